@@ -0,0 +1,284 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import proposed.ring_loading as proposed
+import schrijver.ring_loading as schrijver
+from generate_instance import demands_to_list
+from instance_io import load_instance, save_routing
+from proposed.residual_capacities import compute_link_loads
+from symmetric_matrix import SymmetricMatrix, PackedSymmetricMatrix
+from utils.demand_utils import demand_list_to_arrays
+
+# routing, time_ms and max_load are None and error contains the message if the solver failed
+SolveResult = collections.namedtuple('SolveResult', ['index', 'n', 'routing', 'time_ms', 'max_load', 'error'],
+                                     defaults=[None])
+
+
+SOLVERS = {
+    'proposed': proposed.ring_loading,
+    'schrijver': schrijver.ring_loading,
+}
+
+# conversions of a SymmetricMatrix of demands into the input format of a solver, not included in its timing
+INPUT_CONVERSIONS = {
+    'schrijver': demands_to_list,
+}
+
+
+def solve_batch(instances, solver='proposed', num_workers=None, max_pending=None):
+    """
+    Solves independent instances of ring loading on a pool of worker processes. Demands and routings are passed
+    through shared memory instead of being pickled. Results are yielded in the order in which they are completed.
+    :param instances: iterable of tuples (n, demands), where demands is a SymmetricMatrix
+    :param solver: name of the solver to use, one of SOLVERS
+    :param num_workers: number of worker processes, defaults to the number of CPUs
+    :param max_pending: maximal number of instances submitted but not yet yielded, defaults to 2 * num_workers
+    :return: generator of SolveResult, where index is the position of the instance in instances, time_ms is the
+    time the solver took in milliseconds and max_load is the maximal link load of the routing. Instances the solver
+    fails on yield a SolveResult containing the error instead, so the remaining instances are still solved.
+    """
+    if solver not in SOLVERS:
+        raise Exception(f"Unknown solver {solver}!")
+    num_workers = num_workers or os.cpu_count()
+    max_pending = max_pending or 2 * num_workers
+
+    pending = {}
+    instances = enumerate(instances)
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        try:
+            while True:
+                # keep at most max_pending instances in shared memory
+                for index, (n, demands) in instances:
+                    demands_block = _to_shared_memory(np.asarray(demands))
+                    routing_block = shared_memory.SharedMemory(create=True, size=max(n * n * 8, 1))
+                    future = executor.submit(_solve_shared, solver, n, demands_block.name, demands.dtype.str,
+                                             routing_block.name)
+                    pending[future] = (index, n, demands_block, routing_block)
+                    if len(pending) >= max_pending:
+                        break
+                if len(pending) == 0:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, n, demands_block, routing_block = pending.pop(future)
+                    try:
+                        time_ms, max_load = future.result()
+                        routing = np.ndarray((n, n), dtype=np.float64, buffer=routing_block.buf).copy()
+                    except Exception as e:
+                        result = SolveResult(index, n, None, None, None, f'{type(e).__name__}: {e}')
+                    else:
+                        result = SolveResult(index, n, SymmetricMatrix(n, initial_values=routing,
+                                                                       check_symmetry=False), time_ms, max_load)
+                    finally:
+                        _release(demands_block)
+                        _release(routing_block)
+                    yield result
+        finally:
+            for _, _, demands_block, routing_block in pending.values():
+                _release(demands_block)
+                _release(routing_block)
+
+
+def _solve_shared(solver, n, demands_name, dtype, routing_name):
+    """
+    Worker function that solves a single instance whose demands reside in shared memory and writes the routing back
+    into shared memory.
+    :param solver: name of the solver to use
+    :param n: ring size
+    :param demands_name: name of the shared memory block containing the demands
+    :param dtype: dtype of the demands
+    :param routing_name: name of the shared memory block receiving the routing
+    :return: time the solver took in milliseconds, maximal link load of the routing
+    """
+    demands_block = shared_memory.SharedMemory(name=demands_name)
+    routing_block = shared_memory.SharedMemory(name=routing_name)
+    try:
+        # views into the blocks must not outlive them, hence the separate function
+        return _solve_buffers(solver, n, demands_block.buf, dtype, routing_block.buf)
+    finally:
+        demands_block.close()
+        routing_block.close()
+
+
+def _solve_buffers(solver, n, demands_buffer, dtype, routing_buffer):
+    demands = np.ndarray((n, n), dtype=dtype, buffer=demands_buffer)
+    demands = SymmetricMatrix(n, initial_values=demands, check_symmetry=False)
+    solver_input = INPUT_CONVERSIONS[solver](n, demands) if solver in INPUT_CONVERSIONS else demands
+
+    time_start = time.time_ns()
+    routing = SOLVERS[solver](n, solver_input)
+    time_ms = (time.time_ns() - time_start) / 1e6
+
+    np.ndarray((n, n), dtype=np.float64, buffer=routing_buffer)[:] = routing
+    return time_ms, float(np.max(compute_link_loads(n, routing, demands), initial=0))
+
+
+def _to_shared_memory(array):
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block
+
+
+def _release(block):
+    block.close()
+    block.unlink()
+
+
+def read_instances(paths):
+    """
+    Reads instances lazily, one at a time, from JSONL files and files in the binary format of instance_io.
+    Each line of a JSONL file is an object with the ring size "n", the non-zero demands "demands" as a list of
+    [i, j, d_{ij}] and optionally an "id", which defaults to the file name and line number.
+    :param paths: list of paths of JSONL files (ending in .jsonl, '-' for stdin), binary files or directories of
+    binary files, whose ids are their file names
+    :return: generator of tuples (id, n, demands), where demands is a SymmetricMatrix of the dtype of the demands,
+    i.e. int64 for JSON integers and float64 for JSON numbers with a fraction
+    """
+    for path in paths:
+        if path == '-':
+            yield from _read_jsonl(sys.stdin, 'stdin')
+        elif path.endswith('.jsonl'):
+            with open(path, 'r') as f:
+                yield from _read_jsonl(f, os.path.basename(path))
+        elif os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                yield _read_binary(os.path.join(path, name), name)
+        else:
+            yield _read_binary(path, os.path.basename(path))
+
+
+def _read_jsonl(f, name):
+    for line_number, line in enumerate(f):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        n = record['n']
+        first_nodes, second_nodes, values = demand_list_to_arrays([tuple(demand) for demand in record['demands']])
+        demands = SymmetricMatrix(n, dtype=values.dtype)
+        demands[first_nodes, second_nodes] = values
+        yield str(record.get('id', f'{name}:{line_number}')), n, demands
+
+
+def _read_binary(path, instance_id):
+    n, demands, _ = load_instance(path)
+    if isinstance(demands, PackedSymmetricMatrix):
+        return instance_id, n, demands.to_dense()
+    first_nodes, second_nodes, values = demands
+    matrix = SymmetricMatrix(n, dtype=values.dtype)
+    matrix[first_nodes, second_nodes] = values
+    return instance_id, n, matrix
+
+
+def _prepare_output(path, retry_failed=False):
+    """
+    Reads the ids of the instances already solved from the output of an interrupted run and removes a partially
+    written last line, so that the run can be resumed by appending to the output.
+    :param path: path of the JSONL output
+    :param retry_failed: whether to leave out the ids of instances the solver failed on, so they are solved again
+    :return: set of ids of solved instances
+    """
+    solved = set()
+    if not os.path.exists(path):
+        return solved
+    with open(path, 'rb+') as f:
+        complete_length = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            record = json.loads(line)
+            if 'error' in record and retry_failed:
+                solved.discard(record['id'])
+            else:
+                solved.add(record['id'])
+            complete_length += len(line)
+        f.truncate(complete_length)
+    return solved
+
+
+def run(paths, output, solver='proposed', num_workers=None, max_pending=None, routings_directory=None,
+        retry_failed=False):
+    """
+    Solves a stream of instances and appends one line per solved instance to a JSONL file, containing its id, ring
+    size, solver time and maximal link load, as soon as it is solved. If the solver fails on an instance, the line
+    contains the error instead and the run continues. Instances already contained in the output are skipped, so an
+    interrupted run is resumed by running it again. Prints the throughput of each instance and of the whole run to
+    stderr. Memory is bounded by the max_pending instances in flight.
+    :param paths: list of input paths, see read_instances
+    :param output: path of the JSONL output
+    :param solver: name of the solver to use, one of SOLVERS
+    :param num_workers: number of worker processes, see solve_batch
+    :param max_pending: maximal number of instances in flight, see solve_batch
+    :param routings_directory: directory to write the routing of each instance to in the binary format of
+    instance_io, named by its id with path separators replaced, or None to not write routings
+    :param retry_failed: whether to solve instances again that the solver failed on in an earlier run
+    :return: number of instances solved
+    """
+    solved = _prepare_output(output, retry_failed)
+    if routings_directory is not None:
+        os.makedirs(routings_directory, exist_ok=True)
+
+    # ids of the instances currently in flight, by their position in the stream passed to solve_batch
+    in_flight = {}
+
+    def unsolved_instances():
+        instances = (instance for instance in read_instances(paths) if instance[0] not in solved)
+        for position, (instance_id, n, demands) in enumerate(instances):
+            in_flight[position] = instance_id
+            yield n, demands
+
+    solved_now = []
+    failed_now = []
+    total_time_ms = 0
+    time_start = time.perf_counter()
+    with open(output, 'a') as f:
+        for result in solve_batch(unsolved_instances(), solver, num_workers, max_pending):
+            instance_id = in_flight.pop(result.index)
+            if result.error is not None:
+                f.write(json.dumps({'id': instance_id, 'n': result.n, 'solver': solver, 'error': result.error}) + '\n')
+                f.flush()
+                failed_now.append(instance_id)
+                print(f'{instance_id}: n={result.n}, failed: {result.error}', file=sys.stderr)
+                continue
+            if routings_directory is not None:
+                file_name = instance_id.replace(os.sep, '_')
+                save_routing(os.path.join(routings_directory, file_name), result.n, result.routing,
+                             {'id': instance_id, 'solver': solver})
+            f.write(json.dumps({'id': instance_id, 'n': result.n, 'solver': solver, 'time_ms': result.time_ms,
+                                'max_load': result.max_load}) + '\n')
+            f.flush()
+
+            solved_now.append(instance_id)
+            total_time_ms += result.time_ms
+            elapsed = time.perf_counter() - time_start
+            print(f'{instance_id}: n={result.n}, max load {result.max_load}, {result.time_ms:.2f}ms '
+                  f'({len(solved_now) / elapsed:.2f} instances/s)', file=sys.stderr)
+
+    elapsed = time.perf_counter() - time_start
+    print(f'Solved {len(solved_now)} instances in {elapsed:.2f}s, {len(failed_now)} failed, skipped {len(solved)} '
+          f'already solved: '
+          f'{len(solved_now) / max(elapsed, 1e-9):.2f} instances/s, '
+          f'{total_time_ms / max(len(solved_now), 1):.2f}ms solver time per instance', file=sys.stderr)
+    return len(solved_now)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solves a stream of ring loading instances on a pool of workers.')
+    parser.add_argument('inputs', nargs='+', help='JSONL files, - for stdin, binary instance files or directories')
+    parser.add_argument('--output', required=True, help='JSONL file to append results to, resumed if it exists')
+    parser.add_argument('--solver', default='proposed', choices=list(SOLVERS))
+    parser.add_argument('--workers', type=int, help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--max-pending', type=int, help='maximal number of instances in flight')
+    parser.add_argument('--routings', help='directory to write routings to in the binary format')
+    parser.add_argument('--retry-failed', action='store_true', help='solve instances that failed before again')
+    args = parser.parse_args()
+
+    run(args.inputs, args.output, args.solver, args.workers, args.max_pending, args.routings, args.retry_failed)
@@ -1,18 +1,127 @@
 import numpy as np
 
+from utils.backends import kernel, call_kernel, NUMBA
 
-def compute_capacities(n, demands_across_cuts):
+
+def compute_capacities(n, demands_across_cuts, integer=False, backend=None):
     """
     Computes the capacities as given in the paper. Takes O(n^2) time.
+    Capacity c_i depends on all c_k, k < i, so the rows are processed one after another. By symmetry, the column
+    demands_across_cuts[:i, i] is read as the contiguous row demands_across_cuts[i, :i].
+    :param n: ring size
+    :param demands_across_cuts: SymmetricMatrix or PackedSymmetricMatrix containing all demands across cuts.
+    :param integer: whether to compute exactly in int64, in which case the demands across cuts must be integers scaled
+    by 2 so that all capacities are integers
+    :param backend: kernel backend, see utils.backends
+    :return: np.array containing capacities, in the dtype given by capacity_dtype
+    """
+    if not isinstance(demands_across_cuts, np.ndarray):
+        # packed matrices store their rows in pieces, so generate them one at a time
+        return compute_capacities_by_rows(n, demands_across_cuts.row, integer)
+
+    D = np.ascontiguousarray(demands_across_cuts).view(np.ndarray)
+    c = np.zeros((n,), dtype=capacity_dtype(D.dtype, integer))
+    if n == 0:
+        return c
+    m = D.max()
+    half_m = m // 2 if integer else m / 2
+
+    call_kernel('capacities', D, c, half_m, backend=backend)
+    return c
+
+
+def capacity_dtype(demands_dtype, integer=False):
+    """
+    Determines the dtype of the capacities for demands across cuts of the given dtype. Tight cuts are found by
+    comparing sums of capacities with the demands across cuts, so floating point capacities have the same precision
+    as the demands across cuts. Capacities of integer demands across cuts are halves, hence float32 unless computed
+    exactly in integer mode.
+    :param demands_dtype: dtype of the demands across cuts
+    :param integer: see compute_capacities
+    :return: dtype of the capacities
+    """
+    if integer:
+        return np.dtype(np.int64)
+    if np.issubdtype(demands_dtype, np.floating):
+        return np.dtype(demands_dtype)
+    return np.dtype(np.float32)
+
+
+@kernel('capacities')
+def _capacities_loop(D, c, half_m):
+    """
+    NumPy implementation of the loop of compute_capacities, writing into c. Uses a single preallocated buffer for the
+    differences D[i, :i] - c[:i].
+    """
+    n = c.shape[0]
+    buffer = np.empty((n,), dtype=np.result_type(D.dtype, c.dtype))
+    for i in range(n):
+        row = D[i]
+        max_tight_capacity = np.max(np.subtract(row[:i], c[:i], out=buffer[:i]), initial=0)
+        # x - half_m is monotone in x, also after rounding, so subtracting from the maximum suffices
+        max_m_capacity = max(np.max(row[i + 1:], initial=0) - half_m, 0)
+        c[i] = max(max_tight_capacity, max_m_capacity)
+
+
+@kernel('capacities', NUMBA)
+def _capacities_loop_scalar(D, c, half_m):
+    """
+    Scalar implementation of the loop of compute_capacities, writing into c.
+    """
+    n = c.shape[0]
+    for i in range(n):
+        upper_max = half_m
+        for k in range(i + 1, n):
+            if D[i, k] > upper_max:
+                upper_max = D[i, k]
+        capacity = upper_max - half_m
+        if capacity < 0:
+            capacity = 0
+        for k in range(i):
+            difference = D[i, k] - c[k]
+            if difference > capacity:
+                capacity = difference
+        c[i] = capacity
+
+
+def compute_stacked_capacities(n, demands_across_cuts):
+    """
+    Computes the capacities for a stack of instances of the same size at once. Takes O(B n^2) time.
+    See compute_capacities.
+    :param n: ring size
+    :param demands_across_cuts: np.array of shape (B, n, n) containing demands across cuts
+    :return: np.array of shape (B, n) containing capacities
+    """
+    c = np.zeros((demands_across_cuts.shape[0], n), dtype=capacity_dtype(demands_across_cuts.dtype))
+    m = np.max(demands_across_cuts, axis=(1, 2), initial=0)
+
+    for i in range(n):
+        # by symmetry, demands_across_cuts[:, i, :i] is the column demands_across_cuts[:, :i, i]
+        max_tight_capacity = np.max(demands_across_cuts[:, i, :i] - c[:, :i], axis=1, initial=0)
+        max_m_capacity = np.max(demands_across_cuts[:, i, i + 1:] - m[:, None] / 2, axis=1, initial=0)
+        c[:, i] = np.maximum(max_tight_capacity, max_m_capacity)
+    return c
+
+
+def compute_capacities_by_rows(n, demands_across_cuts_row, integer=False):
+    """
+    Computes the capacities as given in the paper, generating the demands across cuts one row at a time instead of
+    holding them in memory. Uses O(n) space on top of what the rows take to generate.
     :param n: ring size
-    :param demands_across_cuts: SymmetricMatrix containing all demands across cuts.
+    :param demands_across_cuts_row: function mapping an edge g to the np.array of demands across all cuts {g, h}
+    :param integer: see compute_capacities
     :return: np.array containing capacities
     """
-    c = np.zeros((n,), dtype=np.float32)
-    m = np.max(demands_across_cuts)
+    if n == 0:
+        return np.zeros((0,), dtype=capacity_dtype(np.float32, integer))
+    c = np.zeros((n,), dtype=capacity_dtype(demands_across_cuts_row(0).dtype, integer))
+    m = max(np.max(demands_across_cuts_row(i)) for i in range(n))
+    half_m = m // 2 if integer else m / 2
 
     for i in range(n):
-        max_tight_capacity = np.max(demands_across_cuts[:i, i] - c[:i], initial=0)
-        max_m_capacity = np.max(demands_across_cuts[i, i + 1:] - m / 2, initial=0)
+        row = demands_across_cuts_row(i)
+        # by symmetry, row[:i] is the column demands_across_cuts[:i, i]
+        max_tight_capacity = np.max(row[:i] - c[:i], initial=0)
+        max_m_capacity = np.max(row[i + 1:] - half_m, initial=0)
         c[i] = np.maximum(max_tight_capacity, max_m_capacity)
-    return c
\ No newline at end of file
+    return c
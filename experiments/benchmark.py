@@ -0,0 +1,260 @@
+import argparse
+import itertools
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import schrijver.ring_loading as schrijver
+from capacities import compute_capacities
+from constants import FORWARD
+from generate_instance import generate_instance, demands_to_list, TRAFFIC_FAMILIES
+from proposed.contract_instance import contract_instance
+from proposed.demands_across_cuts import compute_demands_across_cuts
+from proposed.ring_loading import route_parallel_demands, split_route_contracted_instance
+from schrijver.demands_across_cuts import compute_demands_across_cuts as schrijver_demands_across_cuts
+from utils.cut_utils import find_tight_cuts
+from utils.demand_utils import find_unrouted_demands
+
+INSTANCE_SIZES = {
+    'proposed': [10, 20, 50, 100, 200, 500, 1000],
+    'schrijver': [10, 20, 50, 100],
+}
+SPARSITIES = [0, 0.5, 0.9]
+# ring size and number of instances solved by each solver before measuring, see warm_up
+WARM_UP_SIZE = 10
+WARM_UP_REPETITIONS = 3
+
+
+def proposed_phases(n, demands):
+    """
+    Generator running the proposed algorithm phase by phase, yielding the name of each phase after it has finished.
+    Mirrors proposed.ring_loading.ring_loading.
+    :param n: ring size
+    :param demands: SymmetricMatrix containing demands
+    """
+    demands_across_cuts = compute_demands_across_cuts(n, demands)
+    yield 'demands_across_cuts'
+    capacities = compute_capacities(n, demands_across_cuts)
+    yield 'capacities'
+    tight_cuts = find_tight_cuts(n, demands_across_cuts, capacities)
+    yield 'tight_cuts'
+    routing = route_parallel_demands(n, tight_cuts)
+    S = []
+    for i, j in find_unrouted_demands(n, routing):
+        if demands[i, j] > 0:
+            S.append((i, j))
+        else:
+            routing[i, j] = FORWARD
+    yield 'parallel_routing'
+    if len(S) == 0:
+        return
+    m, contracted_demands, contracted_capacities = contract_instance(n, routing, S, demands, capacities)
+    yield 'contraction'
+    splits = split_route_contracted_instance(m, contracted_demands, contracted_capacities)
+    for demand, split in zip(S, splits):
+        routing[demand] = split
+    yield 'split_routing'
+
+
+def schrijver_phases(n, demands):
+    """
+    Generator running Schrijver et al.'s algorithm phase by phase, yielding the name of each phase after it has
+    finished. Mirrors schrijver.ring_loading.ring_loading.
+    :param n: ring size
+    :param demands: list of non-zero demands
+    """
+    demands_across_cuts = schrijver_demands_across_cuts(n, demands)
+    yield 'demands_across_cuts'
+    capacities = compute_capacities(n, demands_across_cuts)
+    yield 'capacities'
+    routing, capacities, demands = schrijver.partial_integer_routing(n, demands, demands_across_cuts, capacities)
+    yield 'parallel_routing'
+    schrijver.split_route_crossing_demands(n, routing, demands, capacities)
+    yield 'split_routing'
+
+
+PHASES = {
+    'proposed': proposed_phases,
+    'schrijver': schrijver_phases,
+}
+
+
+def measure_phases(solver, n, demands, memory=False):
+    """
+    Runs the given solver once and measures each phase.
+    :param solver: 'proposed' or 'schrijver'
+    :param n: ring size
+    :param demands: demands in the input format of the solver
+    :param memory: whether to measure peak memory instead of time, which slows down execution
+    :return: dict mapping each phase and 'total' to its time in ms or its peak memory in bytes
+    """
+    results = {}
+    if memory:
+        tracemalloc.start()
+    time_start = time.perf_counter_ns()
+    phase_start = time_start
+    for phase in PHASES[solver](n, demands):
+        phase_end = time.perf_counter_ns()
+        if memory:
+            results[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+        else:
+            results[phase] = (phase_end - phase_start) / 1e6
+        phase_start = time.perf_counter_ns()
+    if memory:
+        results['total'] = max(results.values(), default=0)
+        tracemalloc.stop()
+    else:
+        results['total'] = sum(results.values())
+    return results
+
+
+def generate_benchmark_instance(solver, n, sparsity, seed, family='uniform'):
+    """
+    Generates an integer instance in the input format of the given solver.
+    :return: demands, or None if a list of demands would be empty
+    """
+    demands = generate_instance(n, family, max_demand=100, sparsity=sparsity, integer=True, seed=seed)
+    if solver == 'schrijver':
+        demands = demands_to_list(n, demands, seed)
+        if len(demands) == 0:
+            return None
+    return demands
+
+
+def warm_up(solvers, family='uniform'):
+    """
+    Solves a few small instances with each solver without measuring them, so that compiling the Numba kernels for the
+    dtypes of the instances is not included in the first measurement.
+    :param solvers: list of solver names
+    :param family: traffic family of the instances
+    """
+    for solver in solvers:
+        for seed in range(WARM_UP_REPETITIONS):
+            demands = generate_benchmark_instance(solver, WARM_UP_SIZE, 0, seed, family)
+            if demands is not None:
+                measure_phases(solver, WARM_UP_SIZE, demands)
+
+
+def run_benchmark(solvers, sizes, sparsities, repetitions, family='uniform'):
+    """
+    Benchmarks all phases of the given solvers for all combinations of sizes and sparsities, after warming them up.
+    :param solvers: list of solver names
+    :param sizes: dict mapping solver names to lists of ring sizes
+    :param sparsities: list of sparsities
+    :param repetitions: number of random instances per combination
+    :param family: traffic family of the instances, see generate_instance.TRAFFIC_FAMILIES
+    :return: dict mapping solver names to lists of results, each containing n, sparsity and the median time and
+    peak memory of each phase
+    """
+    warm_up(solvers, family)
+    results = {solver: [] for solver in solvers}
+    for solver in solvers:
+        for n, sparsity in itertools.product(sizes[solver], sparsities):
+            print(f'{solver}: size {n}, sparsity {sparsity}', file=sys.stderr)
+            times, peaks = [], []
+            for seed in range(repetitions):
+                demands = generate_benchmark_instance(solver, n, sparsity, seed, family)
+                if demands is None:
+                    continue
+                times.append(measure_phases(solver, n, demands.copy()))
+                peaks.append(measure_phases(solver, n, demands.copy(), memory=True))
+
+            phases = set(phase for result in times for phase in result)
+            results[solver].append({
+                'n': n,
+                'sparsity': sparsity,
+                'time_ms': {phase: float(np.median([t.get(phase, 0) for t in times])) for phase in phases},
+                'peak_bytes': {phase: int(np.max([p.get(phase, 0) for p in peaks])) for phase in phases},
+            })
+    return results
+
+
+def fit_exponents(results):
+    """
+    Fits the empirical complexity exponent a in time ~ n^a for each solver, sparsity and phase by least squares in
+    log-log space.
+    :param results: results as returned by run_benchmark
+    :return: dict mapping solver names to dicts mapping sparsities to dicts mapping phases to exponents
+    """
+    exponents = {}
+    for solver, solver_results in results.items():
+        exponents[solver] = {}
+        for sparsity in sorted(set(result['sparsity'] for result in solver_results)):
+            rows = [result for result in solver_results if result['sparsity'] == sparsity]
+            phases = set(phase for result in rows for phase in result['time_ms'])
+            exponents[solver][str(sparsity)] = {}
+            for phase in sorted(phases):
+                points = [(result['n'], result['time_ms'][phase]) for result in rows
+                          if result['time_ms'].get(phase, 0) > 0]
+                if len(points) < 2:
+                    continue
+                n, t = np.log(np.asarray(points)).T
+                exponents[solver][str(sparsity)][phase] = float(np.polyfit(n, t, 1)[0])
+    return exponents
+
+
+def find_regressions(report, baseline, time_tolerance, exponent_tolerance):
+    """
+    Compares a benchmark report against a stored baseline.
+    :param report: dict containing 'results' and 'exponents'
+    :param baseline: dict containing 'results' and 'exponents' of a previous run
+    :param time_tolerance: allowed relative increase of the median time of a phase, e.g. 0.2 for 20%
+    :param exponent_tolerance: allowed absolute increase of a fitted exponent
+    :return: list of human-readable descriptions of regressions
+    """
+    regressions = []
+    for solver, solver_results in report['results'].items():
+        baseline_results = {(r['n'], r['sparsity']): r for r in baseline['results'].get(solver, [])}
+        for result in solver_results:
+            baseline_result = baseline_results.get((result['n'], result['sparsity']))
+            if baseline_result is None:
+                continue
+            for phase, time_ms in result['time_ms'].items():
+                baseline_time_ms = baseline_result['time_ms'].get(phase)
+                if baseline_time_ms is not None and time_ms > baseline_time_ms * (1 + time_tolerance):
+                    regressions.append(f'{solver}, n={result["n"]}, sparsity={result["sparsity"]}, {phase}: '
+                                       f'{time_ms:.2f}ms vs. {baseline_time_ms:.2f}ms')
+
+    for solver, solver_exponents in report['exponents'].items():
+        for sparsity, phase_exponents in solver_exponents.items():
+            for phase, exponent in phase_exponents.items():
+                baseline_exponent = baseline['exponents'].get(solver, {}).get(sparsity, {}).get(phase)
+                if baseline_exponent is not None and exponent > baseline_exponent + exponent_tolerance:
+                    regressions.append(f'{solver}, sparsity={sparsity}, {phase}: '
+                                       f'exponent {exponent:.2f} vs. {baseline_exponent:.2f}')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks all phases of the ring loading solvers. Run from the '
+                                                 'repository root as python -m experiments.benchmark.')
+    parser.add_argument('--solvers', nargs='+', default=list(PHASES), choices=list(PHASES))
+    parser.add_argument('--sizes', nargs='+', type=int, help='ring sizes, overriding the defaults of all solvers')
+    parser.add_argument('--sparsities', nargs='+', type=float, default=SPARSITIES)
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--family', default='uniform', choices=list(TRAFFIC_FAMILIES))
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='stored benchmark report to check for regressions against')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--exponent-tolerance', type=float, default=0.3)
+    args = parser.parse_args()
+
+    sizes = {solver: args.sizes for solver in PHASES} if args.sizes else INSTANCE_SIZES
+    results = run_benchmark(args.solvers, sizes, args.sparsities, args.repetitions, args.family)
+    report = {'results': results, 'exponents': fit_exponents(results)}
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report['exponents'], indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = find_regressions(report, json.load(f), args.time_tolerance, args.exponent_tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
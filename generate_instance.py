@@ -1,33 +1,136 @@
-import numpy as np
 import random
 
+import numpy as np
+
 from symmetric_matrix import SymmetricMatrix
 
 
 def generate_random_instance(n, max_demand, sparsity, integer=False, seed=None):
     """
-    Generates a random instance of ring loading of the given size n.
+    Generates a random instance of ring loading of the given size n with uniformly distributed demands.
     :param sparsity: probability in [0, 1] that any demand is zero
     :param max_demand: maximum possible demand, not necessarily assumed
     :param n: ring size, i.e. number of nodes
     :param integer: whether the instance should consist of integer numbers only
+    :param seed: seed of the instance
     :return: SymmetricMatrix containing generated demands
     """
+    return generate_instance(n, 'uniform', max_demand, sparsity, integer, seed)
+
+
+def generate_instance(n, family='uniform', max_demand=100, sparsity=0, integer=False, seed=None, sparse=False,
+                      **family_parameters):
+    """
+    Generates a random instance of ring loading of the given size n from the given traffic family in O(n + K log n)
+    time and O(n + K) space if sparse and O(n^2 log n) time and O(n^2) space otherwise, where K is the number of
+    non-zero demands.
+    First, the demands that are not set to zero are chosen, each subset of the same size being equally likely. Then,
+    each of them is set to max_demand * u * w, where u is uniformly distributed in [0, 1) and w in [0, 1] is given
+    by the traffic family. Both steps draw from their own random streams derived from the seed, so the same seed
+    gives the same instance, dense or sparse, and the same zero demands for all families.
+    :param n: ring size, i.e. number of nodes
+    :param family: name of the traffic family, one of TRAFFIC_FAMILIES
+    :param max_demand: maximum possible demand, not necessarily assumed
+    :param sparsity: fraction in [0, 1] of the demands that are zero
+    :param integer: whether the instance should consist of integer numbers only
+    :param seed: seed of the instance
+    :param sparse: whether to return a list of non-zero demands instead of a SymmetricMatrix
+    :param family_parameters: parameters of the traffic family, see the respective functions
+    :return: SymmetricMatrix containing generated demands, or list of non-zero demands of type (i, j, d_{ij}) with
+    i < j, sorted, if sparse
+    """
     assert 0 <= sparsity <= 1
-    np.random.seed(seed)
-    a = np.random.rand(n, n) * max_demand
-    a = (a + a.T) / 2
-    np.fill_diagonal(a, 0)
+    if family not in TRAFFIC_FAMILIES:
+        raise Exception(f"Unknown traffic family {family}!")
+    selection_rng, family_rng, value_rng = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(3)]
+
+    num_pairs = n * (n - 1) // 2
+    num_demands = num_pairs - int(sparsity * num_pairs)
+    if num_demands == num_pairs:
+        pairs = np.arange(num_pairs)
+    else:
+        pairs = np.sort(selection_rng.choice(num_pairs, num_demands, replace=False))
+    first_nodes, second_nodes = pair_indices_to_nodes(n, pairs)
+
+    weights = TRAFFIC_FAMILIES[family](n, first_nodes, second_nodes, family_rng, **family_parameters)
+    values = max_demand * value_rng.random(num_demands) * weights
     if integer:
-        a = a.astype(np.int)
-    sym_matrix = SymmetricMatrix(n, initial_values=a)
+        values = values.astype(int)
+
+    if sparse:
+        nonzero = values != 0
+        # keep the values as NumPy scalars of the dtype of the instance
+        return list(zip(first_nodes[nonzero].tolist(), second_nodes[nonzero].tolist(), values[nonzero]))
+
+    a = np.zeros((n, n), dtype=values.dtype)
+    a[first_nodes, second_nodes] = values
+    a[second_nodes, first_nodes] = values
+    return SymmetricMatrix(n, initial_values=a, check_symmetry=False)
+
+
+def pair_indices_to_nodes(n, pairs):
+    """
+    Maps indices of demands (i, j), i < j, enumerated row by row, i.e. in the order of np.triu_indices(n, 1), to their
+    end nodes. Takes O(n + K log n) time, where K is the number of indices.
+    :param n: ring size
+    :param pairs: np.array of indices in [0, n(n-1)/2)
+    :return: np.array of first end nodes, np.array of second end nodes
+    """
+    # row i starts at index i * (2n - i - 1) / 2
+    rows = np.arange(n + 1)
+    row_offsets = rows * (2 * n - rows - 1) // 2
+    first_nodes = np.searchsorted(row_offsets, pairs, side='right') - 1
+    second_nodes = pairs - row_offsets[first_nodes] + first_nodes + 1
+    return first_nodes, second_nodes
+
+
+def uniform_weights(n, first_nodes, second_nodes, rng):
+    """
+    Traffic family in which all demands are identically distributed.
+    """
+    return np.ones(len(first_nodes))
+
+
+def gravity_weights(n, first_nodes, second_nodes, rng, sigma=1.0):
+    """
+    Gravity model: each node has a log-normally distributed mass and demands are proportional to the product of the
+    masses of their end nodes.
+    :param sigma: standard deviation of the logarithm of the masses
+    """
+    masses = rng.lognormal(0, sigma, n)
+    largest = np.sort(masses)[-2:]
+    return masses[first_nodes] * masses[second_nodes] / np.prod(largest)
+
+
+def hotspot_weights(n, first_nodes, second_nodes, rng, num_hotspots=None, hotspot_factor=10):
+    """
+    Hotspot model: demands incident to one of a few randomly chosen hotspot nodes, e.g. data centers, are larger by a
+    constant factor than all others.
+    :param num_hotspots: number of hotspot nodes, defaults to 5% of all nodes
+    :param hotspot_factor: ratio of demands incident to hotspots to all other demands
+    """
+    num_hotspots = max(1, n // 20) if num_hotspots is None else num_hotspots
+    is_hotspot = np.zeros(n, dtype=bool)
+    is_hotspot[rng.choice(n, min(num_hotspots, n), replace=False)] = True
+    return np.where(is_hotspot[first_nodes] | is_hotspot[second_nodes], 1, 1 / hotspot_factor)
+
+
+def distance_decay_weights(n, first_nodes, second_nodes, rng, decay_length=None):
+    """
+    Distance decay model: demands decrease exponentially with the distance of their end nodes along the ring.
+    :param decay_length: distance at which demands have decreased by a factor of e, defaults to n / 10
+    """
+    decay_length = max(1, n / 10) if decay_length is None else decay_length
+    distances = np.minimum(second_nodes - first_nodes, n - (second_nodes - first_nodes))
+    return np.exp(-(distances - 1) / decay_length)
+
 
-    rng = np.random.default_rng()
-    zero_indices = rng.choice(n*(n-1)//2, int(sparsity * n*(n-1) / 2), replace=False)
-    triu_indices = np.asarray([(i, j) for i in range(n) for j in range(i+1, n)])
-    zero_indices = triu_indices[zero_indices]
-    sym_matrix[zero_indices[:, 0], zero_indices[:, 1]] = 0
-    return sym_matrix
+TRAFFIC_FAMILIES = {
+    'uniform': uniform_weights,
+    'gravity': gravity_weights,
+    'hotspot': hotspot_weights,
+    'distance_decay': distance_decay_weights,
+}
 
 
 def demands_to_list(n, demands, seed=None):
@@ -39,11 +142,10 @@ def demands_to_list(n, demands, seed=None):
     :param demands: SymmetricMatrix containing demands
     :return: list of non-zero demands
     """
-    demands_list = []
-    for i in range(n):
-        for j in range(i + 1, n):
-            if demands[i, j] != 0:
-                demands_list.append((i, j, demands[i, j]))
-    random.seed(seed)
-    random.shuffle(demands_list)
+    demands = np.asarray(demands)
+    first_nodes, second_nodes = np.nonzero(np.triu(demands != 0, 1))
+    values = demands[first_nodes, second_nodes]
+    # keep the values as NumPy scalars, so the list has the dtype of the matrix
+    demands_list = list(zip(first_nodes.tolist(), second_nodes.tolist(), values))
+    random.Random(seed).shuffle(demands_list)
     return demands_list
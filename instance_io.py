@@ -0,0 +1,215 @@
+import json
+import struct
+
+import numpy as np
+
+from symmetric_matrix import PackedSymmetricMatrix
+from utils.demand_utils import demand_list_to_arrays
+
+# A file consists of MAGIC, the length of the header as little-endian uint64, the header in JSON and the arrays.
+# The header holds the kind of data ('demands', 'routing' or 'arrays'), its format ('packed', 'sparse' or 'raw'), the
+# ring size, user metadata and the dtype, shape and offset of each array relative to the first array. Arrays start at
+# multiples of ALIGNMENT, so that they can be memory-mapped without copying.
+MAGIC = b'RINGLOAD'
+VERSION = 1
+ALIGNMENT = 64
+
+PACKED = 'packed'
+SPARSE = 'sparse'
+RAW = 'raw'
+
+
+def save_instance(path, n, demands, metadata=None, dtype=None):
+    """
+    Writes demands to a binary file. A SymmetricMatrix or PackedSymmetricMatrix is stored as the packed triangle
+    above the main diagonal, a list of demands of type (i, j, d_{ij}) as arrays of end nodes and values.
+    A dense matrix is written one row at a time, so no packed copy of it is made.
+    :param path: path of the file
+    :param n: ring size
+    :param demands: SymmetricMatrix, PackedSymmetricMatrix or list of demands
+    :param metadata: JSON-serializable dict stored alongside the demands, e.g. the seed of the instance
+    :param dtype: dtype to store demand values in, defaults to that of the demands
+    """
+    if isinstance(demands, list):
+        first_nodes, second_nodes, values = demand_list_to_arrays(demands)
+        arrays = _sparse_arrays(first_nodes, second_nodes, values, dtype)
+        _write(path, 'demands', SPARSE, n, arrays, metadata)
+    else:
+        _write(path, 'demands', PACKED, n, _packed_arrays(n, demands, dtype), metadata)
+
+
+def load_instance(path, mmap_mode='r'):
+    """
+    Reads demands written by save_instance.
+    :param path: path of the file
+    :param mmap_mode: mode to memory-map the arrays with as in np.memmap, i.e. 'r' for read-only and 'c' for
+    copy-on-write, or None to read them into memory
+    :return: ring size, demands, metadata. The demands are a PackedSymmetricMatrix if they were stored packed and a
+    tuple of np.arrays of first end nodes, second end nodes and values if they were stored as a list.
+    """
+    n, data_format, arrays, metadata = _read(path, 'demands', mmap_mode)
+    return n, _from_arrays(n, data_format, arrays), metadata
+
+
+def save_routing(path, n, routing, metadata=None):
+    """
+    Writes a routing to a binary file. A SymmetricMatrix is stored as the packed triangle above the main diagonal, a
+    list of type (i, j, r_{ij}) as returned by proposed.sparse_ring_loading as arrays of end nodes and splits.
+    :param path: path of the file
+    :param n: ring size
+    :param routing: SymmetricMatrix or list containing the routing
+    :param metadata: JSON-serializable dict stored alongside the routing, e.g. the solver used
+    """
+    if isinstance(routing, list):
+        first_nodes, second_nodes, values = demand_list_to_arrays(routing)
+        arrays = _sparse_arrays(first_nodes, second_nodes, values, np.float64)
+        _write(path, 'routing', SPARSE, n, arrays, metadata)
+    else:
+        _write(path, 'routing', PACKED, n, _packed_arrays(n, routing, np.float64), metadata)
+
+
+def load_routing(path, mmap_mode='r'):
+    """
+    Reads a routing written by save_routing.
+    :param path: path of the file
+    :param mmap_mode: see load_instance
+    :return: ring size, routing, metadata. The routing is a PackedSymmetricMatrix or a tuple of np.arrays, see
+    load_instance.
+    """
+    n, data_format, arrays, metadata = _read(path, 'routing', mmap_mode)
+    return n, _from_arrays(n, data_format, arrays), metadata
+
+
+def save_arrays(path, n, arrays, metadata=None):
+    """
+    Writes named np.arrays of any shape to a binary file, e.g. intermediate results of a solver.
+    :param path: path of the file
+    :param n: ring size
+    :param arrays: dict of names and np.arrays
+    :param metadata: JSON-serializable dict stored alongside the arrays
+    """
+    arrays = [(name, array.dtype, array.shape, [array]) for name, array in arrays.items()]
+    _write(path, 'arrays', RAW, n, arrays, metadata)
+
+
+def load_arrays(path, mmap_mode='r'):
+    """
+    Reads arrays written by save_arrays.
+    :param path: path of the file
+    :param mmap_mode: see load_instance
+    :return: ring size, dict of names and np.arrays, metadata
+    """
+    n, _, arrays, metadata = _read(path, 'arrays', mmap_mode)
+    return n, arrays, metadata
+
+
+def read_header(path):
+    """
+    Reads only the header of a file, e.g. to look at the metadata of an instance without loading it.
+    :param path: path of the file
+    :return: dict containing the header
+    """
+    with open(path, 'rb') as f:
+        return _read_header(f, path)[0]
+
+
+def _packed_arrays(n, matrix, dtype):
+    """
+    Returns the arrays describing a symmetric matrix as tuples (name, dtype, shape, chunks), where chunks is an
+    iterable of np.arrays that make up the array when concatenated.
+    """
+    if isinstance(matrix, PackedSymmetricMatrix):
+        dtype = np.dtype(dtype or matrix.dtype)
+        return [('values', dtype, (len(matrix.values),), [matrix.values]),
+                ('diagonal_values', dtype, (n,), [matrix.diagonal_values])]
+    matrix = np.asarray(matrix)
+    dtype = np.dtype(dtype or matrix.dtype)
+    rows = (matrix[i, i + 1:] for i in range(n))
+    return [('values', dtype, (n * (n - 1) // 2,), rows),
+            ('diagonal_values', dtype, (n,), [np.diagonal(matrix)])]
+
+
+def _sparse_arrays(first_nodes, second_nodes, values, dtype):
+    dtype = np.dtype(dtype or values.dtype)
+    k = len(values)
+    return [('first_nodes', np.dtype(np.int64), (k,), [first_nodes]),
+            ('second_nodes', np.dtype(np.int64), (k,), [second_nodes]),
+            ('values', dtype, (k,), [values])]
+
+
+def _from_arrays(n, data_format, arrays):
+    if data_format == PACKED:
+        return PackedSymmetricMatrix.from_packed(n, arrays['values'], arrays['diagonal_values'])
+    return arrays['first_nodes'], arrays['second_nodes'], arrays['values']
+
+
+def _write(path, kind, data_format, n, arrays, metadata):
+    """
+    Writes a file as described at the top of this module.
+    """
+    descriptions = {}
+    offset = 0
+    for name, dtype, shape, _ in arrays:
+        descriptions[name] = {'dtype': dtype.str, 'shape': list(shape), 'offset': offset}
+        offset = _align(offset + dtype.itemsize * int(np.prod(shape)))
+    header = {'version': VERSION, 'kind': kind, 'format': data_format, 'n': n, 'metadata': metadata or {},
+              'arrays': descriptions}
+    encoded_header = json.dumps(header).encode()
+    data_offset = _data_offset(len(encoded_header))
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(encoded_header)))
+        f.write(encoded_header)
+        for name, dtype, shape, chunks in arrays:
+            f.seek(data_offset + descriptions[name]['offset'])
+            written = 0
+            for chunk in chunks:
+                chunk = np.ascontiguousarray(chunk, dtype=dtype)
+                f.write(chunk.tobytes())
+                written += chunk.size
+            if written != int(np.prod(shape)):
+                raise Exception(f"Array {name} has {written} entries instead of {int(np.prod(shape))}!")
+
+
+def _read(path, kind, mmap_mode):
+    with open(path, 'rb') as f:
+        header, header_length = _read_header(f, path)
+        if header['kind'] != kind:
+            raise Exception(f"File {path} contains {header['kind']} instead of {kind}!")
+
+        arrays = {}
+        for name, description in header['arrays'].items():
+            dtype, shape = np.dtype(description['dtype']), tuple(description['shape'])
+            offset = _data_offset(header_length) + description['offset']
+            count = int(np.prod(shape))
+            if count == 0:
+                # empty arrays cannot be memory-mapped
+                arrays[name] = np.zeros(shape, dtype=dtype)
+            elif mmap_mode is None:
+                f.seek(offset)
+                arrays[name] = np.fromfile(f, dtype=dtype, count=count).reshape(shape)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=offset, shape=shape)
+    return header['n'], header['format'], arrays, header['metadata']
+
+
+def _read_header(f, path):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise Exception(f"File {path} is not a ring loading file!")
+    header_length, = struct.unpack('<Q', f.read(8))
+    header = json.loads(f.read(header_length))
+    if header['version'] > VERSION:
+        raise Exception(f"File {path} has unsupported version {header['version']}!")
+    return header, header_length
+
+
+def _data_offset(header_length):
+    """
+    Returns the offset of the first array relative to the start of the file.
+    """
+    return _align(len(MAGIC) + 8 + header_length)
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
@@ -1,30 +1,76 @@
 import numpy as np
 
-from constants import UNROUTED
 from proposed.residual_capacities import compute_residual_capacities
-from symmetric_matrix import SymmetricMatrix
 
 
 def contract_instance(n, routing, S, demands, capacities):
     """
     Creates a new, contracted instance of ring loading. Expects all demands in S to be mutually crossing.
-    Takes O(n^2) time.
+    Takes O(n^2) time to compute the residual capacities, the contraction itself takes O(n + m log m) time and O(m)
+    space for m = |S|.
     :param n: ring size
     :param routing: SymmetricMatrix containign current routing
     :param S: list of unrouted demands which are all mutually crossing
     :param demands: SymmetricMatrix containing demands
     :param capacities: np.array containing edge capacities
-    :return: size of contracted instance, indices of unrouted demands, SymmetricMatrix containing new demands,
-    np.array containing new edge capacities
+    :return: size 2m of contracted instance, np.array containing the m contracted demands, where the k-th entry is the
+    demand (k, k + m) corresponding to the k-th demand of sorted(S), np.array containing new edge capacities
     """
     residual_capacities = compute_residual_capacities(n, routing, demands, capacities)
-    remaining_demands = demands.copy()
-    remaining_demands[np.where(routing != UNROUTED)] = 0
 
+    # because all demands are mutually crossing, sorting them by first end node also sorts them by second end node
+    S = sorted(S)
     m = len(S)
-    T = [(i, i + m) for i in range(m)]
+    # exact integer capacities must not lose precision in float32, float64 capacities none at all
+    new_capacities = contract_capacities(n, S, residual_capacities, np.result_type(capacities.dtype, np.float32))
 
-    new_capacities = np.zeros(2 * m, dtype=np.float32)
+    first_nodes, second_nodes = np.asarray(S).T
+    new_demands = np.asarray(demands)[first_nodes, second_nodes].astype(np.float64)
+
+    return 2 * m, new_demands, new_capacities
+
+
+def contract_capacities(n, S, residual_capacities, dtype=None):
+    """
+    Computes the capacities of the contracted instance, where each new edge is the bottleneck of the path between two
+    consecutive end nodes of demands in S. Expects all demands in S to be mutually crossing. Takes O(n + m log m) time
+    for m = |S|.
+    The paths between consecutive end nodes are disjoint and cover the ring, so all bottlenecks are found in a single
+    pass over the residual capacities.
+    :param n: ring size
+    :param S: list of unrouted demands which are all mutually crossing
+    :param residual_capacities: np.array containing residual edge capacities
+    :param dtype: dtype of the new edge capacities, defaults to the dtype of the residual capacities, but at least
+    float32
+    :return: np.array containing new edge capacities
+    """
+    dtype = np.result_type(residual_capacities.dtype, np.float32) if dtype is None else dtype
+    # mutually crossing demands have pairwise distinct end nodes
+    flat_S = np.sort(np.ravel(S))
+    new_capacities = np.minimum.reduceat(residual_capacities[:n], flat_S).astype(dtype)
+
+    # the last path wraps around from the last end node to the first one
+    if flat_S[0] > 0:
+        new_capacities[-1] = min(new_capacities[-1], np.min(residual_capacities[:flat_S[0]]))
+
+    return new_capacities
+
+
+def contract_capacities_sequential(n, S, residual_capacities, dtype=None):
+    """
+    Computes the capacities of the contracted instance, where each new edge is the bottleneck of the path between two
+    consecutive end nodes of demands in S. Expects all demands in S to be mutually crossing. Takes O(n) time, one path
+    at a time. Reference implementation of contract_capacities.
+    :param n: ring size
+    :param S: list of unrouted demands which are all mutually crossing
+    :param residual_capacities: np.array containing residual edge capacities
+    :param dtype: dtype of the new edge capacities, defaults to the dtype of the residual capacities, but at least
+    float32
+    :return: np.array containing new edge capacities
+    """
+    dtype = np.result_type(residual_capacities.dtype, np.float32) if dtype is None else dtype
+    m = len(S)
+    new_capacities = np.zeros(2 * m, dtype=dtype)
     # because all demands are mutually crossing, all elements in S[:, 0] are <= than all in S[:, 1]
     flat_S = sorted([i for demand in S for i in demand])
     # k = [1, 2, ..., m-2]
@@ -39,8 +85,4 @@ def contract_instance(n, routing, S, demands, capacities):
     new_capacities[-1] = min(np.min(residual_capacities[i:n], initial=np.inf),
                              np.min(residual_capacities[0:j], initial=np.inf))
 
-    new_demands = SymmetricMatrix(2 * m, initial_values=np.zeros((2 * m, 2 * m)))
-    for k in range(m):
-        new_demands[k, k + m] = demands[S[k]]
-
-    return 2 * m, T, new_demands, new_capacities
+    return new_capacities
@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class CutSlackTree:
+    """
+    Segment tree over the links of a contracted instance that maintains the minimal slack of all cuts within a range
+    of links while capacities of ranges of links are decreased. Takes O(m) time to build and O(log m) time per
+    operation.
+    While the contracted demands (k, k + m/2) are routed in order, the cuts {l, l'}, l <= l', queried for the front
+    route of demand k lie in {k, ..., k + m/2 - 1}, so they are crossed exactly by the demands k' with
+    l < k' <= l', all of which are not routed yet. Hence their slack is c_l + c_l' - (P_l' - P_l), where P_x is the sum
+    of the demands k' <= x, which splits into a_l + b_l' with a_l = c_l + P_l and b_l' = c_l' - P_l'. For l = l', this
+    is twice the capacity of link l, the slack of the cut consisting of the single link l.
+    Each node stores the minima of a and b and the minimal a_l + b_l' over l <= l' in its range. Decreasing the
+    capacities of all links in its range by M decreases them by M, M and 2M, respectively, so decreases are applied
+    lazily.
+    """
+    def __init__(self, capacities, demand_prefix_sums):
+        """
+        :param capacities: np.array containing the capacities of the m links
+        :param demand_prefix_sums: np.array containing P_x for each link x
+        """
+        self.size = len(capacities)
+        self.min_a = [np.inf] * (4 * self.size)
+        self.min_b = [np.inf] * (4 * self.size)
+        self.min_slack_pair = [np.inf] * (4 * self.size)
+        self.pending = [0.0] * (4 * self.size)
+
+        capacities = np.asarray(capacities, dtype=np.float64)
+        demand_prefix_sums = np.asarray(demand_prefix_sums, dtype=np.float64)
+        if self.size > 0:
+            self._build(1, 0, self.size, (capacities + demand_prefix_sums).tolist(),
+                        (capacities - demand_prefix_sums).tolist())
+
+    def add(self, start, end, delta):
+        """
+        Adds delta to the capacities of the links start, ..., end - 1.
+        """
+        if start < end:
+            self._add(1, 0, self.size, start, end, delta)
+
+    def min_slack(self, start, end):
+        """
+        :return: minimal slack of all cuts {l, l'} with start <= l <= l' < end, or infinity if the range is empty
+        """
+        if start >= end:
+            return np.inf
+        return self._query(1, 0, self.size, start, end)[2]
+
+    def _build(self, node, lo, hi, a, b):
+        if hi - lo == 1:
+            self.min_a[node], self.min_b[node] = a[lo], b[lo]
+            self.min_slack_pair[node] = a[lo] + b[lo]
+            return
+        mid = (lo + hi) // 2
+        self._build(2 * node, lo, mid, a, b)
+        self._build(2 * node + 1, mid, hi, a, b)
+        self._pull(node)
+
+    def _pull(self, node):
+        left, right = 2 * node, 2 * node + 1
+        self.min_a[node] = min(self.min_a[left], self.min_a[right])
+        self.min_b[node] = min(self.min_b[left], self.min_b[right])
+        # a pair l <= l' either lies in one child or has l in the left and l' in the right child
+        self.min_slack_pair[node] = min(self.min_slack_pair[left], self.min_slack_pair[right],
+                                        self.min_a[left] + self.min_b[right])
+
+    def _apply(self, node, delta):
+        self.min_a[node] += delta
+        self.min_b[node] += delta
+        self.min_slack_pair[node] += 2 * delta
+        self.pending[node] += delta
+
+    def _push(self, node):
+        if self.pending[node] != 0:
+            self._apply(2 * node, self.pending[node])
+            self._apply(2 * node + 1, self.pending[node])
+            self.pending[node] = 0.0
+
+    def _add(self, node, lo, hi, start, end, delta):
+        if end <= lo or hi <= start:
+            return
+        if start <= lo and hi <= end:
+            self._apply(node, delta)
+            return
+        self._push(node)
+        mid = (lo + hi) // 2
+        self._add(2 * node, lo, mid, start, end, delta)
+        self._add(2 * node + 1, mid, hi, start, end, delta)
+        self._pull(node)
+
+    def _query(self, node, lo, hi, start, end):
+        """
+        :return: tuple of the minimal a, minimal b and minimal slack within the intersection of the node's range and
+        [start, end), or None if it is empty
+        """
+        if end <= lo or hi <= start:
+            return None
+        if start <= lo and hi <= end:
+            return self.min_a[node], self.min_b[node], self.min_slack_pair[node]
+        self._push(node)
+        mid = (lo + hi) // 2
+        left = self._query(2 * node, lo, mid, start, end)
+        right = self._query(2 * node + 1, mid, hi, start, end)
+        if left is None or right is None:
+            return left or right
+        return min(left[0], right[0]), min(left[1], right[1]), min(left[2], right[2], left[0] + right[1])
@@ -1,11 +1,209 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 from symmetric_matrix import SymmetricMatrix
+from utils.backends import kernel, call_kernel, NUMBA
+
+
+# rings of at least this size are computed in tiles, see compute_tiled_demands_across_cuts
+MIN_TILED_SIZE = 4096
+TILE_SIZE = 256
+
+
+def compute_demands_across_cuts(n, demands, num_threads=None, tile_size=TILE_SIZE):
+    """
+    Computes the demands across all cuts using 2D prefix sums. Takes O(n^2) time.
+    The cut {g, h} with g < h is crossed by exactly those demands with one end in {g+1, ..., h}, hence
+    D[g, h] = sum of row sums over {g+1, ..., h} - 2 * (sum of demands inside {g+1, ..., h}).
+    Rings of at least MIN_TILED_SIZE nodes are computed by compute_tiled_demands_across_cuts.
+    :param n: ring size
+    :param demands: SymmetricMatrix containing demands
+    :param num_threads: number of threads for large rings, defaults to the number of CPUs
+    :param tile_size: number of rows per tile for large rings
+    :return: SymmetricMatrix of demands across cuts
+    """
+    if n >= MIN_TILED_SIZE:
+        D = compute_tiled_demands_across_cuts(n, demands, num_threads, tile_size)
+    else:
+        D = compute_stacked_demands_across_cuts(n, np.asarray(demands)[None])[0]
+    return SymmetricMatrix(n, initial_values=D, check_symmetry=False)
+
+
+def compute_tiled_demands_across_cuts(n, demands, num_threads=None, tile_size=TILE_SIZE):
+    """
+    Computes the demands across all cuts in tiles of tile_size consecutive rows on a pool of threads, relying on
+    NumPy releasing the GIL. Takes O(n^2) time and O(n (n / tile_size + num_threads * tile_size)) space besides the
+    result, instead of the (n + 1)^2 prefix sums of compute_stacked_demands_across_cuts.
+    The 2D prefix sums P are a blocked scan: a first pass sums the columns of each tile independently, the prefix
+    sums of these sums over the tiles give the row P[a0] above each tile starting at row a0, and a second pass
+    computes the rows of P within each tile from it and turns them into rows of D independently again. Rows g of
+    the same tile have h > g for all columns h right of the tile and h < g for all columns left of it, where D[g, h]
+    is given by the symmetric formula of compute_stacked_demands_across_cuts.
+    :param n: ring size
+    :param demands: SymmetricMatrix or np.array containing demands
+    :param num_threads: number of threads, defaults to the number of CPUs
+    :param tile_size: number of rows per tile
+    :return: np.array of demands across cuts
+    """
+    demands = np.asarray(demands)
+    acc_dtype = np.int64 if np.issubdtype(demands.dtype, np.integer) else np.float64
+    starts = list(range(0, n, tile_size))
+
+    def sum_tile(a0):
+        a1 = min(a0 + tile_size, n)
+        tile = demands[a0:a1]
+        # sums of the demands (r, s) with r < s within each column s, the tile's part of the diagonal of P
+        upper_sums = np.zeros(n, dtype=acc_dtype)
+        upper_sums[a0:a1] = np.triu(tile[:, a0:a1], 1).sum(axis=0, dtype=acc_dtype)
+        upper_sums[a1:] = tile[:, a1:].sum(axis=0, dtype=acc_dtype)
+        return tile.sum(axis=1, dtype=acc_dtype), tile.sum(axis=0, dtype=acc_dtype), upper_sums
+
+    D = np.empty((n, n), dtype=demands.dtype)
+    with ThreadPoolExecutor(num_threads or os.cpu_count()) as executor:
+        tile_sums = list(executor.map(sum_tile, starts))
+        # row_sums[x] = P[x + 1, n], inner_sums[x] = P[x + 1, x + 1]
+        row_sums = np.cumsum(np.concatenate([sums[0] for sums in tile_sums]))
+        upper_sums = np.sum([sums[2] for sums in tile_sums], axis=0)
+        inner_sums = np.cumsum(2 * upper_sums + np.diagonal(demands).astype(acc_dtype))
+        # P[a0, 1:] for each tile starting at row a0
+        column_sums = np.stack([sums[1] for sums in tile_sums])
+        tops = np.cumsum(np.cumsum(column_sums, axis=0) - column_sums, axis=1)
+
+        def fill_tile(k):
+            a0 = starts[k]
+            a1 = min(a0 + tile_size, n)
+            rows = np.arange(a0, a1)[:, None]
+            # P[a0 + 1:a1 + 1, 1:], turned into the rows of D in place
+            P = np.cumsum(demands[a0:a1], axis=0, dtype=acc_dtype)
+            np.cumsum(P, axis=1, out=P)
+            P += tops[k]
+            P *= 2
+            P -= inner_sums
+            P -= inner_sums[rows]
+            P[:, a1:] += row_sums[a1:]
+            P[:, a1:] -= row_sums[rows]
+            P[:, :a0] -= row_sums[:a0]
+            P[:, :a0] += row_sums[rows]
+            block = row_sums[None, a0:a1] - row_sums[rows]
+            P[:, a0:a1] += np.where(np.arange(a0, a1)[None, :] > rows, block, -block)
+            P[:, a0:a1][np.diag_indices(a1 - a0)] = 0
+            D[a0:a1] = P
+
+        list(executor.map(fill_tile, range(len(starts))))
+    return D
+
+
+def compute_stacked_demands_across_cuts(n, demands, backend=None):
+    """
+    Computes the demands across all cuts for a stack of instances of the same size at once. Takes O(B n^2) time.
+    See compute_demands_across_cuts.
+    :param n: ring size
+    :param demands: np.array of shape (B, n, n) containing B symmetric demand matrices
+    :param backend: kernel backend, see utils.backends
+    :return: np.array of shape (B, n, n) of demands across cuts
+    """
+    demands = np.asarray(demands)
+    acc_dtype = np.int64 if np.issubdtype(demands.dtype, np.integer) else np.float64
+
+    # P[b, a, c] is the sum of all demands[b, r, s] with r < a and s < c
+    P = np.zeros((demands.shape[0], n + 1, n + 1), dtype=acc_dtype)
+    np.cumsum(demands, axis=1, dtype=acc_dtype, out=P[:, 1:, 1:])
+    np.cumsum(P[:, 1:, 1:], axis=2, out=P[:, 1:, 1:])
+
+    D = call_kernel('demands_across_cuts', P, backend=backend)
+    return D.astype(demands.dtype)
+
+
+@kernel('demands_across_cuts')
+def _demands_across_cuts_from_prefix_sums(P):
+    """
+    NumPy implementation of the demands across cuts given the 2D prefix sums P of shape (B, n + 1, n + 1).
+    """
+    n = P.shape[1] - 1
+
+    # prefix sums over whole rows and over the square blocks {0, ..., a-1} x {0, ..., a-1}, for a = g + 1
+    row_sums = P[:, 1:, n]
+    inner_sums = np.diagonal(P, axis1=1, axis2=2)[:, 1:]
+
+    # only valid on the upper triangle, i.e. for g < h
+    D = row_sums[:, None, :] - row_sums[:, :, None] - inner_sums[:, None, :] - inner_sums[:, :, None] \
+        + 2 * P[:, 1:, 1:]
+    D = np.triu(D, 1)
+    D += D.transpose(0, 2, 1)
+    return D
+
+
+@kernel('demands_across_cuts', NUMBA)
+def _demands_across_cuts_from_prefix_sums_scalar(P):
+    """
+    Scalar implementation of the demands across cuts given the 2D prefix sums P of shape (B, n + 1, n + 1).
+    Computes each entry of the upper triangle without temporaries and mirrors it afterwards.
+    """
+    n = P.shape[1] - 1
+    D = np.zeros((P.shape[0], n, n), dtype=P.dtype)
+    for b in range(P.shape[0]):
+        for g in range(n):
+            for h in range(g + 1, n):
+                D[b, g, h] = P[b, h + 1, n] - P[b, g + 1, n] - P[b, h + 1, h + 1] - P[b, g + 1, g + 1] \
+                             + 2 * P[b, g + 1, h + 1]
+        for g in range(n):
+            for h in range(g + 1, n):
+                D[b, h, g] = D[b, g, h]
+    return D
+
+
+def update_demands_across_cuts(n, demands_across_cuts, demand, delta):
+    """
+    Updates the demands across cuts in place after a single demand has changed by delta. Only the cuts crossed by the
+    demand are touched, i.e. the cuts {g, h} with i <= g < j <= h or g < i <= h < j. Takes O(n^2) time in the worst
+    case.
+    :param n: ring size
+    :param demands_across_cuts: SymmetricMatrix of demands across cuts
+    :param demand: tuple of indices of the demand
+    :param delta: change of the demand
+    :return: SymmetricMatrix of updated demands across cuts
+    """
+    i, j = min(demand), max(demand)
+    # write both triangles directly, SymmetricMatrix.__setitem__ cannot transpose non-square blocks
+    D = np.asarray(demands_across_cuts)
+    D[i:j, j:] += delta
+    D[j:, i:j] += delta
+    D[:i, i:j] += delta
+    D[i:j, :i] += delta
+    return demands_across_cuts
+
 
+def compute_demands_across_cuts_row(n, g, first_nodes, second_nodes, values):
+    """
+    Computes the demands across all cuts {g, h}, 0 <= h < n, for a fixed edge g from a list of demands.
+    Takes O(n + K) time and space, where K is the number of demands.
+    A demand (i, j), i < j, that does not straddle g, i.e. that has both ends on the same side of g, crosses exactly
+    the cuts {g, h} with i <= h < j. A straddling demand crosses exactly the others.
+    :param n: ring size
+    :param g: index of the fixed edge
+    :param first_nodes: np.array of first end nodes of the demands, where first_nodes < second_nodes
+    :param second_nodes: np.array of second end nodes of the demands
+    :param values: np.array of demand values
+    :return: np.array of demands across the cuts {g, h}
+    """
+    acc_dtype = np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64
+
+    straddling = (first_nodes <= g) & (g < second_nodes)
+    weights = np.where(straddling, -values, values).astype(acc_dtype)
+    diffs = np.bincount(first_nodes, weights, minlength=n) - np.bincount(second_nodes, weights, minlength=n)
 
-def compute_demands_across_cuts(n, demands):
+    row = np.sum(values[straddling], dtype=acc_dtype) + np.cumsum(diffs[:n])
+    # the cut {g, g} is crossed by no demand, without the rounding errors of the sums above
+    row[g] = 0
+    return row.astype(values.dtype)
+
+
+def compute_demands_across_cuts_recursive(n, demands):
     """
     Computes the demands across all cuts using the recursive equation. Takes O(n^2) time.
+    Reference implementation of compute_demands_across_cuts.
     :param n: ring size
     :param demands: SymmetricMatrix containing demands
     :return: SymmetricMatrix of demands across cuts
@@ -27,31 +225,44 @@ def compute_demands_across_cuts(n, demands):
     return D
 
 
-def demands_across_cuts_edge_fixed(n, S, demands):
+def compute_contracted_demands_across_cuts(m, contracted_demands):
     """
-    Computes the demand across cuts for all cuts of the form {k, e} with e - n/2 <= k < e, where e is the unique edge
-    such that the cut {e-1, e} is crossed only by the first demand in S.
-    Furthermore assumes the special case that all demands are crossing and that the given instance is contracted.
-    :param S: sorted list of indices of remaining demands
-    :param demands: SymmetricMatrix of demands
-    :param n: ring size
+    Computes the demands across all cuts of a contracted instance, whose demands are the mutually crossing demands
+    (k, k + m/2), from their values in O(m^2) time without materializing its demand matrix.
+    Each node x is the end node of the demand x mod m/2, so the cut {g, h}, g < h, is crossed by the demands ending in
+    {g+1, ..., h} except for those with both end nodes in it, i.e. the demands k with g < k <= h - m/2, twice.
+    :param m: size of the contracted instance
+    :param contracted_demands: np.array containing the m/2 contracted demands, where the k-th entry is the demand
+    (k, k + m/2)
     :return: np.array of demands across cuts
     """
-    # assert that size is even - for contracted crossing instances, it always is
-    assert n % 2 == 0
-    demands_across_cuts = np.zeros(n // 2 - 1)
-
-    # the first cut {edge - n / 2 + 1, edge} is crossed by all remaining demands except the one we are trying to route,
-    # which is the first element of S.
-    if len(S) > 1:
-        dim_1_indices, dim_2_indices = zip(*S)
-        demands_across_cuts[0] = np.sum(demands[dim_1_indices, dim_2_indices])
-    else:
-        # if there is only one demand left, the demand across the first cut (and all other cuts) is 0.
-        demands_across_cuts[0] = 0
+    half = m // 2
+    demand_sums = np.concatenate(([0], np.cumsum(contracted_demands, dtype=np.float64)))
+    node_sums = np.concatenate((demand_sums, demand_sums[-1] + demand_sums[1:]))
+
+    g = np.arange(m)[:, None]
+    h = np.arange(m)[None, :]
+    # demands with both end nodes in {g+1, ..., h}
+    inner_start, inner_end = np.minimum(g + 1, half), np.clip(h - half + 1, 0, half)
+    inner_sums = np.where(inner_end > inner_start, demand_sums[inner_end] - demand_sums[inner_start], 0)
+
+    D = np.triu(node_sums[h + 1] - node_sums[g + 1] - 2 * inner_sums, 1)
+    D += D.T
+    return D
 
-    # assumes S to be sorted
-    for k in range(1, len(S)):
-        demands_across_cuts[k] = demands_across_cuts[k - 1] - demands[S[k - 1]]
 
+def demands_across_cuts_edge_fixed(m, remaining_demands):
+    """
+    Computes the demand across cuts for all cuts of the form {l, j - 1} with i <= l < j - 1 of a contracted instance,
+    where (i, j) = (i, i + m/2) is the demand being routed and the remaining demands are (k, k + m/2), k > i.
+    The cut {i + t, j - 1} is crossed by exactly the remaining demands with k > i + t, so the demands across cuts are
+    the suffix sums of the remaining demands. Takes O(m) time.
+    :param m: size of the contracted instance
+    :param remaining_demands: np.array containing the values of the remaining demands in order
+    :return: np.array of demands across cuts
+    """
+    # assert that size is even - for contracted crossing instances, it always is
+    assert m % 2 == 0
+    demands_across_cuts = np.zeros(m // 2 - 1)
+    demands_across_cuts[:len(remaining_demands)] = np.cumsum(remaining_demands[::-1])[::-1]
     return demands_across_cuts
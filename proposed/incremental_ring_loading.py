@@ -0,0 +1,134 @@
+import numpy as np
+
+from capacities import compute_capacities
+from constants import UNROUTED, FORWARD
+from proposed.contract_instance import contract_capacities
+from proposed.demands_across_cuts import compute_demands_across_cuts, update_demands_across_cuts
+from proposed.residual_capacities import compute_link_loads, update_link_loads
+from proposed.ring_loading import route_parallel_demands, split_route_contracted_instance
+from symmetric_matrix import SymmetricMatrix
+from utils.cut_utils import find_tight_cuts, update_tight_cuts, default_tolerance
+from utils.demand_utils import find_unrouted_demands
+
+# number of changed float demands after which the demands across cuts and link loads are recomputed from scratch, since
+# each update adds rounding errors to them
+REFRESH_INTERVAL = 64
+
+
+class IncrementalRingLoading:
+    """
+    Stateful solver for ring loading that keeps the demands across cuts, capacities, tight cuts and the partial
+    integer routing between changes of single demands, and only recomputes what a change invalidates:
+    - the demands across cuts change only on the cuts crossed by the changed demand,
+    - the partial integer routing only depends on the tight cuts, which are kept as long as they remain tight,
+    - the link loads of the partial integer routing change only along the route of the changed demand.
+    """
+    def __init__(self, n, demands, tolerance=None, tie_break='first', seed=None):
+        """
+        :param n: ring size
+        :param demands: SymmetricMatrix containing demands, which is copied
+        :param tolerance: relative tolerance of tight cuts, see proposed.ring_loading.ring_loading
+        :param tie_break: policy choosing among multiple tight cuts of a link, see utils.cut_utils.find_tight_cuts
+        :param seed: seed of the random tie-break policy
+        """
+        self.n = n
+        self.demands = SymmetricMatrix(n, initial_values=np.array(demands), check_symmetry=False)
+        self.tolerance = default_tolerance(self.demands.dtype) if tolerance is None else tolerance
+        self.tie_break = tie_break
+        self.seed = seed
+        self._float_updates = 0
+
+        self.demands_across_cuts = compute_demands_across_cuts(n, self.demands)
+        self.capacities = compute_capacities(n, self.demands_across_cuts)
+        self.tight_cuts = find_tight_cuts(n, self.demands_across_cuts, self.capacities, self.tolerance,
+                                          self.tie_break, self.seed)
+        self._route_parallel_demands()
+
+        self.routing = None
+
+    def update_demand(self, i, j, value):
+        """
+        Sets the demand between i and j to the given value.
+        :param i: first end node of the demand
+        :param j: second end node of the demand
+        :param value: new value of the demand, which must be representable in the dtype of the demands
+        """
+        self.update_demands([(i, j, value)])
+
+    def update_demands(self, updates):
+        """
+        Sets several demands at once, recomputing capacities and tight cuts only once. Takes O(n^2) time.
+        :param updates: list of tuples (i, j, d_{ij}) containing the new values of the demands
+        """
+        dtype = self.demands.dtype
+        changed = False
+        for i, j, value in updates:
+            if dtype.type(value) != value:
+                raise Exception(f"Demand {value} between {i} and {j} is not representable as {dtype}!")
+            delta = dtype.type(value) - self.demands[i, j]
+            if delta == 0:
+                continue
+            changed = True
+            self.demands[i, j] = value
+            update_demands_across_cuts(self.n, self.demands_across_cuts, (i, j), delta)
+            # routed demands keep their route, so their load changes by delta along it
+            update_link_loads(self.n, self.partial_link_loads, (i, j), delta, UNROUTED, self.partial_routing[i, j])
+            if np.issubdtype(dtype, np.inexact):
+                self._float_updates += 1
+
+        if not changed:
+            return
+
+        if self._float_updates >= REFRESH_INTERVAL:
+            # discard the rounding errors accumulated by the updates
+            self.demands_across_cuts = compute_demands_across_cuts(self.n, self.demands)
+            self.partial_link_loads = compute_link_loads(self.n, self.partial_routing, self.demands)
+            self._float_updates = 0
+
+        self.capacities = compute_capacities(self.n, self.demands_across_cuts)
+        changed_links = update_tight_cuts(self.n, self.demands_across_cuts, self.capacities, self.tight_cuts,
+                                          self.tolerance, self.tie_break, self.seed)
+        if len(changed_links) > 0:
+            self._route_parallel_demands()
+
+        self.routing = None
+
+    def solve(self):
+        """
+        Computes a minimal solution for the current demands, reusing the state kept since the last change.
+        Takes O(n^2) time if tight cuts have changed and O(n + |S|^2) otherwise.
+        :return: SymmetricMatrix containing a minimal solution
+        """
+        if self.routing is not None:
+            return self.routing.copy()
+
+        routing = self.partial_routing.copy()
+
+        # remove zero demands from S and route w.l.o.g forward
+        pruned_S = []
+        for i, j in self.S:
+            if self.demands[i, j] > 0:
+                pruned_S.append((i, j))
+            else:
+                routing[i, j] = FORWARD
+
+        if len(pruned_S) > 0:
+            # zero demands routed forward do not add to the link loads
+            residual_capacities = self.capacities - self.partial_link_loads
+
+            m = len(pruned_S)
+            contracted_capacities = contract_capacities(self.n, pruned_S, residual_capacities)
+            first_nodes, second_nodes = np.asarray(pruned_S).T
+            contracted_demands = np.asarray(self.demands)[first_nodes, second_nodes].astype(np.float64)
+
+            splits = split_route_contracted_instance(2 * m, contracted_demands, contracted_capacities)
+            for demand, split in zip(pruned_S, splits):
+                routing[demand] = split
+
+        self.routing = routing
+        return routing.copy()
+
+    def _route_parallel_demands(self):
+        self.partial_routing = route_parallel_demands(self.n, self.tight_cuts)
+        self.S = find_unrouted_demands(self.n, self.partial_routing)
+        self.partial_link_loads = compute_link_loads(self.n, self.partial_routing, self.demands)
@@ -1,6 +1,7 @@
 import numpy as np
 
 from constants import FORWARD, BACKWARD
+from utils.backends import kernel, call_kernel, NUMBA
 
 
 def compute_residual_capacities(n, routing, demands, old_capacities):
@@ -18,7 +19,149 @@ def compute_residual_capacities(n, routing, demands, old_capacities):
 
 def compute_link_loads(n, routing, demands):
     """
-    Computes link loads given a (partial) routing, previous capacities and demands in O(n^2) time.
+    Computes link loads given a (partial) routing and demands in O(n^2) time.
+    :param n: ring size
+    :param routing: SymmetricMatrix containing the (partial) routing
+    :param demands: SymmetricMatrix of demands
+    :return: np.array of link loads
+    """
+    forward_loads, backward_loads = compute_directional_link_loads(n, routing, demands)
+    return forward_loads + backward_loads
+
+
+def compute_directional_link_loads(n, routing, demands, backend=None):
+    """
+    Computes forward and backward link loads given a (partial) routing and demands in a single pass over the upper
+    triangle in O(n^2) time. Unrouted demands do not contribute to any link load.
+    A demand (i, j), i < j, routed forward adds to the links i, ..., j-1, i.e. it adds to a difference array at i and
+    subtracts from it at j. Routed backward, it adds to all links except for i, ..., j-1.
+    Also accepts stacks of routings and demands of shape (B, n, n), in which case loads of shape (B, n) are returned.
+    :param n: ring size
+    :param routing: SymmetricMatrix containing the (partial) routing
+    :param demands: SymmetricMatrix of demands
+    :param backend: kernel backend, see utils.backends
+    :return: np.array of forward link loads, np.array of backward link loads
+    """
+    routing = np.asarray(routing).view(np.ndarray)
+    demands = np.asarray(demands).view(np.ndarray)
+    if routing.ndim == 2:
+        forward_loads, backward_loads = call_kernel('directional_link_loads', routing[None], demands[None],
+                                                    backend=backend)
+        return forward_loads[0], backward_loads[0]
+    return call_kernel('directional_link_loads', routing, demands, backend=backend)
+
+
+@kernel('directional_link_loads')
+def _directional_link_loads(routing, demands):
+    """
+    NumPy implementation of the forward and backward link loads of a stack of routings and demands of shape (B, n, n).
+    """
+    routed = np.triu((0 <= routing) & (routing <= 1), 1)
+    routed_demands = np.where(routed, demands, 0)
+    forward_weights = routed_demands * routing
+    backward_weights = routed_demands - forward_weights
+
+    # difference arrays: demands leave node i at position i and arrive at node j at position j
+    forward_diffs = np.sum(forward_weights, axis=-1, dtype=np.float64) \
+                    - np.sum(forward_weights, axis=-2, dtype=np.float64)
+    backward_diffs = np.sum(backward_weights, axis=-1, dtype=np.float64) \
+                     - np.sum(backward_weights, axis=-2, dtype=np.float64)
+
+    forward_loads = np.cumsum(forward_diffs, axis=-1)
+    backward_loads = np.sum(backward_weights, axis=(-2, -1), dtype=np.float64)[..., None] \
+                     - np.cumsum(backward_diffs, axis=-1)
+
+    return forward_loads, backward_loads
+
+
+@kernel('directional_link_loads', NUMBA)
+def _directional_link_loads_scalar(routing, demands):
+    """
+    Scalar implementation of the forward and backward link loads of a stack of routings and demands of shape
+    (B, n, n). Accumulates the difference arrays row by row without temporaries.
+    """
+    B, n = routing.shape[0], routing.shape[1]
+    forward_loads = np.zeros((B, n))
+    backward_loads = np.zeros((B, n))
+    for b in range(B):
+        backward_total = 0.0
+        for i in range(n):
+            for j in range(i + 1, n):
+                r = routing[b, i, j]
+                if 0 <= r <= 1:
+                    forward_weight = np.float64(demands[b, i, j]) * r
+                    backward_weight = np.float64(demands[b, i, j]) - forward_weight
+                    forward_loads[b, i] += forward_weight
+                    forward_loads[b, j] -= forward_weight
+                    backward_loads[b, i] += backward_weight
+                    backward_loads[b, j] -= backward_weight
+                    backward_total += backward_weight
+        # turn the difference arrays into loads
+        for k in range(1, n):
+            forward_loads[b, k] += forward_loads[b, k - 1]
+            backward_loads[b, k] += backward_loads[b, k - 1]
+        for k in range(n):
+            backward_loads[b, k] = backward_total - backward_loads[b, k]
+    return forward_loads, backward_loads
+
+
+def compute_link_loads_from_list(n, first_nodes, second_nodes, values, routing):
+    """
+    Computes link loads given a (partial) routing of a list of demands in O(n + K) time, where K is the number of
+    demands. Unrouted demands do not contribute to any link load.
+    :param n: ring size
+    :param first_nodes: np.array of first end nodes of the demands, where first_nodes < second_nodes
+    :param second_nodes: np.array of second end nodes of the demands
+    :param values: np.array of demand values
+    :param routing: np.array containing the (partial) routing of each demand
+    :return: np.array of link loads
+    """
+    routed = (0 <= routing) & (routing <= 1)
+    forward_weights = np.where(routed, values * routing, 0)
+    backward_weights = np.where(routed, values * (1 - routing), 0)
+
+    # forward weights are added to the links first_node, ..., second_node - 1 and backward weights to all others
+    weights = forward_weights - backward_weights
+    diffs = np.bincount(first_nodes, weights, minlength=n) - np.bincount(second_nodes, weights, minlength=n)
+    return np.sum(backward_weights, dtype=np.float64) + np.cumsum(diffs[:n])
+
+
+def update_link_loads(n, link_loads, demand, value, old_split, new_split):
+    """
+    Updates link loads in place after the split of a single demand has changed. Takes O(n) time.
+    :param n: ring size
+    :param link_loads: np.array of link loads, as computed by compute_link_loads
+    :param demand: tuple of indices of the demand
+    :param value: value of the demand
+    :param old_split: previous routing of the demand, may be UNROUTED
+    :param new_split: new routing of the demand, may be UNROUTED
+    :return: np.array of updated link loads
+    """
+    i, j = min(demand), max(demand)
+    old_forward, old_backward = _split_fractions(old_split)
+    new_forward, new_backward = _split_fractions(new_split)
+
+    link_loads[i:j] += value * (new_forward - old_forward)
+    link_loads[:i] += value * (new_backward - old_backward)
+    link_loads[j:] += value * (new_backward - old_backward)
+    return link_loads
+
+
+def _split_fractions(split):
+    """
+    Returns the fractions of a demand routed forward and backward, given its routing.
+    :param split: routing of a demand
+    :return: forward fraction, backward fraction
+    """
+    if 0 <= split <= 1:
+        return split, 1 - split
+    return 0, 0
+
+
+def compute_link_loads_recursive(n, routing, demands):
+    """
+    Computes link loads given a (partial) routing and demands in O(n^2) time, one node at a time.
+    Reference implementation of compute_link_loads.
     :param n: ring size
     :param routing: SymmetricMatrix containing the (partial) routing
     :param demands: SymmetricMatrix of demands
@@ -1,26 +1,64 @@
-import collections
-
 import numpy as np
 
 from capacities import compute_capacities
-from constants import UNROUTED, FORWARD
+from constants import UNROUTED, FORWARD, BACKWARD
 from proposed.contract_instance import contract_instance
-from proposed.demands_across_cuts import demands_across_cuts_edge_fixed, compute_demands_across_cuts
-from symmetric_matrix import SymmetricMatrix
-from utils.cut_utils import demand_parallel_to_cut, find_tight_cuts, determine_route_parallel_to_cut
-from utils.demand_utils import find_unrouted_demands
-
-
-def ring_loading(n, demands):
+from proposed.cut_slack_tree import CutSlackTree
+from proposed.demands_across_cuts import demands_across_cuts_edge_fixed, compute_demands_across_cuts, \
+    compute_contracted_demands_across_cuts
+from symmetric_matrix import SymmetricMatrix, PackedSymmetricMatrix
+from utils.backends import kernel, call_kernel, NUMBA
+from utils.cut_utils import demand_parallel_to_cut, find_tight_cuts, determine_route_parallel_to_cut, \
+    next_crossing_demands, determine_routes_parallel_to_cut, tight_cut_index, default_tolerance
+from utils.demand_utils import find_unrouted_demands, scale_integer_demands
+from utils.instrumentation import NO_INSTRUMENTATION
+from utils.sanity_checks import verify_routing
+
+
+def ring_loading(n, demands, instrumentation=NO_INSTRUMENTATION, integer=False, return_certificate=False,
+                 artifacts=None, tolerance=None, tie_break='first', seed=None):
     """
     Computes a minimal soulution to ring loading in O(n^2) time.
     :param n: ring size
-    :param demands: SymmetricMatrix containing demands
-    :return: SymmetricMatrix containing a minimal solution
+    :param demands: SymmetricMatrix containing demands, or PackedSymmetricMatrix, which is unpacked first
+    :param instrumentation: Instrumentation collecting statistics of each phase, disabled by default
+    :param integer: whether to compute demands across cuts, capacities and tight cuts exactly in int64 arithmetic,
+    which requires integer demands. The split routing still takes place in float64, since each split halves a slack.
+    :param return_certificate: whether to verify the solution, reusing the demands across cuts and capacities
+    :param artifacts: dict of intermediate results 'demands_across_cuts', 'capacities' and 'tight_cuts' of an earlier
+    solve of the same instance in the same mode and with the same tight cut options. Results contained in it are
+    reused, all others are added to it.
+    :param tolerance: relative tolerance of tight cuts, see utils.cut_utils.find_tight_cuts. Defaults to
+    utils.cut_utils.FLOAT64_TOLERANCE for float64 demands and to exact comparison otherwise.
+    :param tie_break: policy choosing among multiple tight cuts of a link, see utils.cut_utils.find_tight_cuts
+    :param seed: seed of the random tie-break policy
+    :return: SymmetricMatrix containing a minimal solution, and a Certificate if return_certificate is set
     """
+    if isinstance(demands, PackedSymmetricMatrix):
+        # all phases index the demands densely, unpacking them once is cheaper than unpacking them in each phase
+        demands = demands.to_dense()
+    if integer:
+        # scaling by 2 removes all halves from the capacities. Routings are fractions and thus scale invariant.
+        demands = scale_integer_demands(n, demands)
+    if tolerance is None:
+        tolerance = default_tolerance(demands.dtype)
+
     # determine partial integer routing, set of unrouted demands S and capacities
-    pi_routing, S, capacities, _, _ = partial_integer_routing(n, demands)
+    pi_routing, S, capacities, demands_across_cuts, _ = partial_integer_routing(n, demands, instrumentation, integer,
+                                                                                artifacts, tolerance, tie_break, seed)
+    routing = _route_unrouted_demands(n, pi_routing, S, demands, capacities, instrumentation)
+
+    if not return_certificate:
+        return routing
+    with instrumentation.phase('verification'):
+        certificate = verify_routing(n, demands, routing, demands_across_cuts, capacities, scale=2 if integer else 1)
+    return routing, certificate
+
 
+def _route_unrouted_demands(n, pi_routing, S, demands, capacities, instrumentation):
+    """
+    Completes a partial integer routing by routing zero demands forward and splitting all others.
+    """
     # remove zero demands from S and route w.l.o.g forward
     pruned_S = []
     for i, j in S:
@@ -28,32 +66,59 @@ def ring_loading(n, demands):
             pruned_S.append((i, j))
         else:
             pi_routing[i, j] = FORWARD
+    instrumentation.record('unrouted_demands', len(pruned_S))
 
     if len(pruned_S) == 0:
         return pi_routing
 
     # Route remaining demands by splitting
-    routing = split_route_crossing_demands(n, pi_routing, pruned_S, demands, capacities)
+    routing = split_route_crossing_demands(n, pi_routing, pruned_S, demands, capacities, instrumentation)
 
     return routing
 
 
-def partial_integer_routing(n, demands):
+def partial_integer_routing(n, demands, instrumentation=NO_INSTRUMENTATION, integer=False, artifacts=None,
+                            tolerance=0, tie_break='first', seed=None):
     """
     A O(n^2) algorithm for finding a partial integer routing that leaves at most n/2 demands unrouted
     :param n: instance size
     :param demands: SymmetricMatrix containing demands
-    :return:
+    :param instrumentation: Instrumentation collecting statistics of each phase, disabled by default
+    :param integer: whether to compute capacities exactly in int64 arithmetic, which requires integer demands scaled
+    by 2
+    :param artifacts: dict of intermediate results to reuse and complete, see ring_loading
+    :param tolerance: see ring_loading
+    :param tie_break: see ring_loading
+    :param seed: see ring_loading
+    :return: partial routing, list of unrouted demands, capacities, demands across cuts (None if they were not needed
+    because capacities and tight cuts were given), tight cuts
     """
-    demands_across_cuts = compute_demands_across_cuts(n, demands)
-    capacities = compute_capacities(n, demands_across_cuts)
-    tight_cuts = find_tight_cuts(n, demands_across_cuts, capacities)
-
-    # route some parallel demands
-    pi_routing = route_parallel_demands(n, tight_cuts)
-
-    # Find indices of unrouted demands
-    S = find_unrouted_demands(n, pi_routing)
+    artifacts = {} if artifacts is None else artifacts
+    demands_across_cuts = artifacts.get('demands_across_cuts')
+    if demands_across_cuts is None and not ('capacities' in artifacts and 'tight_cuts' in artifacts):
+        with instrumentation.phase('demands_across_cuts'):
+            demands_across_cuts = artifacts['demands_across_cuts'] = compute_demands_across_cuts(n, demands)
+    capacities = artifacts.get('capacities')
+    if capacities is None:
+        with instrumentation.phase('capacities'):
+            capacities = artifacts['capacities'] = compute_capacities(n, demands_across_cuts, integer)
+    tight_cuts = artifacts.get('tight_cuts')
+    if tight_cuts is None:
+        with instrumentation.phase('tight_cuts'):
+            tight_cuts = artifacts['tight_cuts'] = find_tight_cuts(n, demands_across_cuts, capacities, tolerance,
+                                                                   tie_break, seed)
+    if instrumentation.enabled and demands_across_cuts is not None:
+        # count the cuts {i, j}, i < j, that are tight up to the tolerance, as find_tight_cuts does
+        indptr, indices = tight_cut_index(n, demands_across_cuts, capacities, tolerance)
+        links = np.repeat(np.arange(n), np.diff(indptr))
+        instrumentation.record('tight_cuts', int(np.count_nonzero(indices > links)))
+
+    with instrumentation.phase('parallel_routing'):
+        # route some parallel demands
+        pi_routing = route_parallel_demands(n, tight_cuts)
+
+        # Find indices of unrouted demands
+        S = find_unrouted_demands(n, pi_routing)
 
     return pi_routing, S, capacities, demands_across_cuts, tight_cuts
 
@@ -65,6 +130,92 @@ def route_parallel_demands(n, tight_cuts):
     :param tight_cuts:
     :return:
     """
+    routing = route_stacked_parallel_demands(n, np.asarray(tight_cuts)[None])[0]
+    return SymmetricMatrix(n, initial_values=routing, check_symmetry=False)
+
+
+def route_stacked_parallel_demands(n, tight_cuts, backend=None):
+    """
+    Routes all demands that are parallel to the given tight cuts for a stack of instances of the same size at once in
+    O(B n^2) time. For each tight cut, the demands (i, next_unrouted[i]), (i, next_unrouted[i] + 1), ... that are
+    parallel to it are routed for all nodes i at once.
+    :param n: ring size
+    :param tight_cuts: np.array of shape (B, n) containing one tight cut for each link
+    :param backend: kernel backend, see utils.backends
+    :return: np.array of shape (B, n, n) containing the partial routings
+    """
+    routing = np.full((tight_cuts.shape[0], n, n), UNROUTED, dtype=np.float64)
+    call_kernel('route_parallel_demands', n, tight_cuts, routing, backend=backend)
+    return routing
+
+
+@kernel('route_parallel_demands')
+def _route_stacked_parallel_demands(n, tight_cuts, routing):
+    """
+    NumPy implementation of route_stacked_parallel_demands, writing into routing.
+    """
+    B = tight_cuts.shape[0]
+
+    # flattened over the stack: node i of instance b is at position b * n + i
+    instances = np.repeat(np.arange(B), n)
+    nodes = np.tile(np.arange(0, n), B)
+    next_unrouted = (nodes + 1) % n  # = [2, 3, 4, ..., n, 1] for each instance
+    for g in range(n):
+        h = tight_cuts[instances, g]
+        next_crossing = next_crossing_demands(n, nodes, next_unrouted, (g, h))
+
+        # all demands (i, j) with next_unrouted[i] <= j < next_crossing[i] (circularly) are parallel to the cut
+        run_lengths = (next_crossing - next_unrouted) % n
+        if np.any(run_lengths):
+            first_nodes = np.repeat(nodes, run_lengths)
+            run_starts = np.cumsum(run_lengths) - run_lengths
+            offsets = np.arange(len(first_nodes)) - np.repeat(run_starts, run_lengths)
+            second_nodes = (np.repeat(next_unrouted, run_lengths) + offsets) % n
+            run_instances = np.repeat(instances, run_lengths)
+
+            routes = determine_routes_parallel_to_cut(first_nodes, second_nodes, (g, tight_cuts[run_instances, g]))
+            routing[run_instances, first_nodes, second_nodes] = routes
+            routing[run_instances, second_nodes, first_nodes] = routes
+
+        next_unrouted = next_crossing
+
+
+@kernel('route_parallel_demands', NUMBA)
+def _route_stacked_parallel_demands_scalar(n, tight_cuts, routing):
+    """
+    Scalar implementation of route_stacked_parallel_demands, writing into routing. Scans the demands of each node one
+    at a time as in route_parallel_demands_sequential.
+    """
+    next_unrouted = np.empty(n, dtype=np.int64)
+    for b in range(tight_cuts.shape[0]):
+        for i in range(n):
+            next_unrouted[i] = (i + 1) % n
+        for g in range(n):
+            h = tight_cuts[b, g]
+            cut_start, cut_end = min(g, h), max(g, h)
+            for i in range(n):
+                j = next_unrouted[i]
+                while i != j:
+                    first, second = min(i, j), max(i, j)
+                    if first <= cut_start < second <= cut_end or cut_start < first <= cut_end < second:
+                        # the demand crosses the cut
+                        break
+                    if first <= cut_start and cut_end < second:
+                        routing[b, i, j] = routing[b, j, i] = BACKWARD
+                    else:
+                        routing[b, i, j] = routing[b, j, i] = FORWARD
+                    j = (j + 1) % n
+                next_unrouted[i] = j
+
+
+def route_parallel_demands_sequential(n, tight_cuts):
+    """
+    Routes all demands that are parallel to the given tight cuts in O(n^2) time, one demand at a time.
+    Reference implementation of route_parallel_demands.
+    :param n:
+    :param tight_cuts:
+    :return:
+    """
     routing = SymmetricMatrix(n, initial_values=UNROUTED * np.ones((n, n)))
 
     next_unrouted = np.roll(np.arange(0, n), -1)  # = [2, 3, 4, ..., n, 1]
@@ -80,7 +231,7 @@ def route_parallel_demands(n, tight_cuts):
     return routing
 
 
-def split_route_crossing_demands(n, routing, S, demands, capacities):
+def split_route_crossing_demands(n, routing, S, demands, capacities, instrumentation=NO_INSTRUMENTATION):
     """
     Splits the <= n/2 non-zero demands that remain unrouted after a partial integer routing in O(n^2) time.
     :param n: instance size
@@ -88,13 +239,73 @@ def split_route_crossing_demands(n, routing, S, demands, capacities):
     :param S: list of indices of non-zero unrouted demands
     :param demands: SymmetricMatrix containing remaining demands
     :param capacities: residual capacities
+    :param instrumentation: Instrumentation collecting statistics of each phase, disabled by default
     :return:
     """
     # we know that all unrouted demands are crossing, i.e. |S| <= n/2
-    m, T, contracted_demands, contracted_capacities = contract_instance(n, routing, S, demands, capacities)
+    with instrumentation.phase('contraction'):
+        m, contracted_demands, contracted_capacities = contract_instance(n, routing, S, demands, capacities)
+    instrumentation.record('contracted_size', m)
+
+    with instrumentation.phase('split_routing'):
+        splits = split_route_contracted_instance(m, contracted_demands, contracted_capacities)
+
+    # sorted(S)[k] corresponds to the contracted demand (k, k + m/2):
+    for demand, split in zip(sorted(S), splits):
+        routing[demand] = split
+
+    return routing
 
+
+def split_route_contracted_instance(m, contracted_demands, contracted_capacities):
+    """
+    Splits the mutually crossing demands (k, k + m/2) of a contracted instance in O(m log m) time.
+    Each demand is routed forward as far as the minimal slack of the cuts along its front route allows. The slacks
+    are maintained by a CutSlackTree under the capacity decreases of each routed demand, so no cut slacks are
+    materialized.
+    :param m: size of the contracted instance
+    :param contracted_demands: np.array containing the m/2 contracted demands, where the k-th entry is the demand
+    (k, k + m/2)
+    :param contracted_capacities: np.array containing the contracted capacities
+    :return: np.array containing the fraction of each contracted demand that is routed forward
+    """
+    half = m // 2
+    # the sum of the demands whose first end node is at most x, for each link x
+    demand_sums = np.cumsum(contracted_demands, dtype=np.float64)
+    demand_prefix_sums = np.concatenate((demand_sums, np.full(m - half, demand_sums[-1])))
+    tree = CutSlackTree(contracted_capacities, demand_prefix_sums)
+
+    splits = np.zeros(half)
+    for k in range(half):
+        i, j = k, k + half
+        demand = contracted_demands[k]
+
+        # route as much as the cuts along the front route, i.e. within links i, ..., j - 1, allow. Rounding may leave
+        # slightly negative slacks, which must not route a negative amount
+        M = max(0, min(demand, tree.min_slack(i, j) / 2))
+        splits[k] = M / demand
+
+        # decrease capacities accordingly
+        tree.add(i, j, -M)
+        tree.add(0, i, -(demand - M))
+        tree.add(j, m, -(demand - M))
+
+    return splits
+
+
+def split_route_contracted_instance_sequential(m, contracted_demands, contracted_capacities):
+    """
+    Splits the mutually crossing demands (k, k + m/2) of a contracted instance in O(m^2) time, maintaining the
+    minimal slack of the cuts starting at each link in an array. Reference implementation of
+    split_route_contracted_instance.
+    :param m: size of the contracted instance
+    :param contracted_demands: np.array containing the m/2 contracted demands, where the k-th entry is the demand
+    (k, k + m/2)
+    :param contracted_capacities: np.array containing the contracted capacities
+    :return: np.array containing the fraction of each contracted demand that is routed forward
+    """
     # compute demands across cuts and cut slacks in contracted instance in O(n^2) time
-    demands_across_cuts = compute_demands_across_cuts(m, contracted_demands)
+    demands_across_cuts = compute_contracted_demands_across_cuts(m, contracted_demands)
     pairwise_capacities_sum = contracted_capacities[:, None] + contracted_capacities[None, :]
     cut_slacks = pairwise_capacities_sum - demands_across_cuts
 
@@ -104,21 +315,18 @@ def split_route_crossing_demands(n, routing, S, demands, capacities):
     for i in range(m // 2 - 1):
         min_slacks[i] = np.min(cut_slacks[i, i + 1:m // 2])
 
-    # sorted(S)[i] corresponds bijectively to sorted(T)[i]:
-    S = sorted(S)
-
-    # turn T into a deque for fast popleft().
-    T = collections.deque(T)
+    splits = np.zeros(m // 2)
 
     # O(n^2)
-    for k in range(len(T)):
-        i, j = T.popleft()
+    for k in range(m // 2):
+        i, j = k, k + m // 2
+        demand = contracted_demands[k]
 
         # skip in first step - we already calculated the appropriate minimal slacks during initialization
         if k > 0:
             # compute demands across cuts where one edge in the cut is {j, j+1}, i.e. the dacs of all demands of
             # the form {x, j}, i <= x < j, of which there are n / 2 - 1
-            demands_across_cuts_j = demands_across_cuts_edge_fixed(m, T, contracted_demands)  # O(n)
+            demands_across_cuts_j = demands_across_cuts_edge_fixed(m, contracted_demands[k + 1:])  # O(n)
 
             slacks_j = contracted_capacities[j - 1] + contracted_capacities[i:j - 1] - demands_across_cuts_j  # O(n)
 
@@ -126,22 +334,19 @@ def split_route_crossing_demands(n, routing, S, demands, capacities):
             for l in range(i, j - 1):
                 min_slacks[l] = min(min_slacks[l], slacks_j[l - i])
 
-        # find minimal slack along front route
-        min_slack = 0 if i == j - 1 else np.min(min_slacks[i:j - 1])  # O(n)
+        # find minimal slack along front route, including the cuts consisting of a single link
+        min_slack = np.min(min_slacks[i:j - 1], initial=2 * np.min(contracted_capacities[i:j]))  # O(n)
 
-        # route demand (i, j)
-        M = min(contracted_demands[i, j], min_slack / 2)
-        routing[S[k]] = M / contracted_demands[i, j]
+        # route demand (i, j), at least nothing forward if rounding left a slightly negative slack
+        M = max(0, min(demand, min_slack / 2))
+        splits[k] = M / demand
 
         # decrease capacities accordingly
         contracted_capacities[i:j] -= M
-        contracted_capacities[:i] -= contracted_demands[i, j] - M
-        contracted_capacities[j:] -= contracted_demands[i, j] - M
-
-        # set routed demand to zero in remaining contracted demands
-        contracted_demands[i, j] = 0
+        contracted_capacities[:i] -= demand - M
+        contracted_capacities[j:] -= demand - M
 
         # the slacks of all cuts in [i+1, j) are decreased by 2 * M (M for each edge in the cut)
         min_slacks[i:j - 1] -= 2 * M
 
-    return routing
+    return splits
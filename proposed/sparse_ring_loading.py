@@ -0,0 +1,120 @@
+import numpy as np
+
+from capacities import compute_capacities_by_rows
+from constants import UNROUTED, FORWARD
+from proposed.contract_instance import contract_capacities
+from proposed.demands_across_cuts import compute_demands_across_cuts_row
+from proposed.residual_capacities import compute_link_loads_from_list
+from proposed.ring_loading import split_route_contracted_instance
+from utils.cut_utils import find_tight_cuts_by_rows, demands_parallel_to_cut, determine_routes_parallel_to_cut, \
+    default_tolerance
+from utils.demand_utils import demand_list_to_arrays
+
+
+def ring_loading(n, demands, tolerance=None, tie_break='first', seed=None):
+    """
+    Computes a minimal solution to ring loading for a list of K demands in O(n^2 + nK) time and O(n + K^2) space.
+    The demands across cuts are never held in memory as a whole, which makes this suitable for large rings with few
+    non-zero demands.
+    :param n: ring size
+    :param demands: list containing demands in the form (i, j, d_{i, j})
+    :param tolerance: relative tolerance of tight cuts, see utils.cut_utils.find_tight_cuts. Defaults to
+    utils.cut_utils.FLOAT64_TOLERANCE for float64 demands, e.g. Python floats, and to exact comparison otherwise.
+    :param tie_break: policy choosing among multiple tight cuts of a link, see utils.cut_utils.find_tight_cuts
+    :param seed: seed of the random tie-break policy
+    :return: list containing the routing in the form (i, j, r_{i, j}), where i < j and r_{i, j} is the fraction of
+    d_{i, j} routed forward, in the order of demands
+    """
+    first_nodes, second_nodes, values = demand_list_to_arrays(demands)
+    if tolerance is None:
+        tolerance = default_tolerance(values.dtype)
+
+    # determine partial integer routing, set of unrouted demands S and capacities
+    routing, S, capacities = partial_integer_routing(n, first_nodes, second_nodes, values, tolerance,
+                                                     tie_break, seed)
+
+    # remove zero demands from S and route w.l.o.g forward
+    routing[S[values[S] <= 0]] = FORWARD
+    S = S[values[S] > 0]
+
+    if len(S) > 0:
+        # Route remaining demands by splitting
+        routing = split_route_crossing_demands(n, routing, S, first_nodes, second_nodes, values, capacities)
+
+    return list(zip(first_nodes.tolist(), second_nodes.tolist(), routing.tolist()))
+
+
+def partial_integer_routing(n, first_nodes, second_nodes, values, tolerance=0, tie_break='first', seed=None):
+    """
+    A O(n^2 + nK) algorithm for finding a partial integer routing of a list of demands that leaves only mutually
+    crossing demands unrouted.
+    :param n: ring size
+    :param first_nodes: np.array of first end nodes of the demands, where first_nodes < second_nodes
+    :param second_nodes: np.array of second end nodes of the demands
+    :param values: np.array of demand values
+    :param tolerance: relative tolerance of tight cuts, see utils.cut_utils.find_tight_cuts
+    :param tie_break: see ring_loading
+    :param seed: see ring_loading
+    :return: np.array containing the partial routing, np.array of indices of unrouted demands, np.array of capacities
+    """
+    def demands_across_cuts_row(g):
+        return compute_demands_across_cuts_row(n, g, first_nodes, second_nodes, values)
+
+    capacities = compute_capacities_by_rows(n, demands_across_cuts_row)
+    tight_cuts = find_tight_cuts_by_rows(n, demands_across_cuts_row, capacities, tolerance, tie_break, seed)
+
+    # route parallel demands
+    routing = route_parallel_demands(n, tight_cuts, first_nodes, second_nodes)
+
+    # Find indices of unrouted demands
+    S = np.flatnonzero(routing == UNROUTED)
+
+    return routing, S, capacities
+
+
+def route_parallel_demands(n, tight_cuts, first_nodes, second_nodes):
+    """
+    Routes all demands that are parallel to any of the given tight cuts in O(nK) time.
+    Any two parallel demands have an edge in between them such that at least one of them is parallel to its tight cut,
+    hence the remaining demands are mutually crossing.
+    :param n: ring size
+    :param tight_cuts: np.array containing one tight cut for each link
+    :param first_nodes: np.array of first end nodes of the demands, where first_nodes < second_nodes
+    :param second_nodes: np.array of second end nodes of the demands
+    :return: np.array containing the partial routing of each demand
+    """
+    routing = np.full(len(first_nodes), UNROUTED, dtype=np.float64)
+
+    for g in range(n):
+        h = tight_cuts[g]
+        parallel = np.flatnonzero((routing == UNROUTED) & demands_parallel_to_cut(first_nodes, second_nodes, (g, h)))
+        routing[parallel] = determine_routes_parallel_to_cut(first_nodes[parallel], second_nodes[parallel], (g, h))
+
+    return routing
+
+
+def split_route_crossing_demands(n, routing, S, first_nodes, second_nodes, values, capacities):
+    """
+    Splits the mutually crossing non-zero demands that remain unrouted after a partial integer routing.
+    Takes O(n + K + |S|^2) time.
+    :param n: ring size
+    :param routing: np.array containing the partial integer routing of each demand
+    :param S: np.array of indices of non-zero unrouted demands
+    :param first_nodes: np.array of first end nodes of the demands, where first_nodes < second_nodes
+    :param second_nodes: np.array of second end nodes of the demands
+    :param values: np.array of demand values
+    :param capacities: np.array of capacities
+    :return: np.array containing the complete routing of each demand
+    """
+    residual_capacities = capacities - compute_link_loads_from_list(n, first_nodes, second_nodes, values, routing)
+
+    # because all demands in S are mutually crossing, sorting by first end nodes also sorts by second end nodes
+    S = S[np.argsort(first_nodes[S])]
+    m = len(S)
+
+    contracted_capacities = contract_capacities(n, list(zip(first_nodes[S], second_nodes[S])), residual_capacities)
+    contracted_demands = values[S].astype(np.float64)
+
+    routing[S] = split_route_contracted_instance(2 * m, contracted_demands, contracted_capacities)
+
+    return routing
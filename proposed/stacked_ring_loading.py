@@ -0,0 +1,97 @@
+import numpy as np
+
+from capacities import compute_stacked_capacities
+from constants import UNROUTED, FORWARD
+from proposed.contract_instance import contract_capacities
+from proposed.demands_across_cuts import compute_stacked_demands_across_cuts
+from proposed.residual_capacities import compute_link_loads
+from proposed.ring_loading import route_stacked_parallel_demands, split_route_contracted_instance
+from utils.cut_utils import find_stacked_tight_cuts, default_tolerance
+
+
+def ring_loading(n, demands, tolerance=None, tie_break='first', seed=None):
+    """
+    Computes minimal solutions to a stack of B instances of ring loading of the same size in O(B n^2) time.
+    All phases up to the split routing of the remaining crossing demands operate on the whole stack at once.
+    :param n: ring size
+    :param demands: np.array of shape (B, n, n) containing B symmetric demand matrices
+    :param tolerance: relative tolerance of tight cuts with the same default as proposed.ring_loading.ring_loading
+    :param tie_break: policy choosing among multiple tight cuts of a link, see utils.cut_utils.find_tight_cuts
+    :param seed: seed of the random tie-break policy
+    :return: np.array of shape (B, n, n) containing a minimal solution for each instance
+    """
+    demands = np.asarray(demands)
+    if tolerance is None:
+        tolerance = default_tolerance(demands.dtype)
+
+    # determine partial integer routings, sets of unrouted demands and capacities
+    routing, S, capacities, _, _ = partial_integer_routing(n, demands, tolerance, tie_break, seed)
+    residual_capacities = capacities - compute_link_loads(n, routing, demands)
+
+    for b in range(demands.shape[0]):
+        # remove zero demands from S and route w.l.o.g forward
+        pruned_S = []
+        for i, j in S[b]:
+            if demands[b, i, j] > 0:
+                pruned_S.append((i, j))
+            else:
+                routing[b, i, j] = routing[b, j, i] = FORWARD
+
+        if len(pruned_S) > 0:
+            # Route remaining demands by splitting
+            split_route_crossing_demands(n, routing[b], pruned_S, demands[b], residual_capacities[b])
+
+    return routing
+
+
+def partial_integer_routing(n, demands, tolerance=0, tie_break='first', seed=None):
+    """
+    Finds partial integer routings for a stack of instances of the same size in O(B n^2) time, each leaving at most
+    n/2 demands unrouted.
+    :param n: ring size
+    :param demands: np.array of shape (B, n, n) containing B symmetric demand matrices
+    :param tolerance: see ring_loading
+    :param tie_break: see ring_loading
+    :param seed: see ring_loading
+    :return: np.array of shape (B, n, n) of partial routings, list of lists of indices of unrouted demands,
+    np.array of shape (B, n) of capacities, np.array of shape (B, n, n) of demands across cuts,
+    np.array of shape (B, n) of tight cuts
+    """
+    demands_across_cuts = compute_stacked_demands_across_cuts(n, demands)
+    capacities = compute_stacked_capacities(n, demands_across_cuts)
+    tight_cuts = find_stacked_tight_cuts(n, demands_across_cuts, capacities, tolerance, tie_break, seed)
+
+    # route some parallel demands
+    routing = route_stacked_parallel_demands(n, tight_cuts)
+
+    # Find indices of unrouted demands
+    instances, first_nodes, second_nodes = np.nonzero(np.triu(routing == UNROUTED, 1))
+    S = [[] for _ in range(demands.shape[0])]
+    for b, i, j in zip(instances.tolist(), first_nodes.tolist(), second_nodes.tolist()):
+        S[b].append((i, j))
+
+    return routing, S, capacities, demands_across_cuts, tight_cuts
+
+
+def split_route_crossing_demands(n, routing, S, demands, residual_capacities):
+    """
+    Splits the <= n/2 non-zero demands of a single instance that remain unrouted after a partial integer routing in
+    O(n^2) time, writing into the given routing.
+    :param n: ring size
+    :param routing: np.array of shape (n, n) containing the partial integer routing
+    :param S: sorted list of indices of non-zero unrouted demands
+    :param demands: np.array of shape (n, n) containing demands
+    :param residual_capacities: np.array of residual capacities after the partial integer routing
+    :return: np.array containing the complete routing
+    """
+    m = len(S)
+
+    contracted_capacities = contract_capacities(n, S, residual_capacities)
+    first_nodes, second_nodes = np.asarray(S).T
+    contracted_demands = demands[first_nodes, second_nodes].astype(np.float64)
+
+    splits = split_route_contracted_instance(2 * m, contracted_demands, contracted_capacities)
+    for (i, j), split in zip(S, splits):
+        routing[i, j] = routing[j, i] = split
+
+    return routing
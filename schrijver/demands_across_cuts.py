@@ -1,10 +1,47 @@
+import numpy as np
+
 from symmetric_matrix import SymmetricMatrix
 from utils.cut_utils import demand_crosses_cut
+from utils.demand_utils import demand_list_to_arrays
 
 
 def compute_demands_across_cuts(n, demands):
+    """
+    Computes all demands across cuts by scattering each demand into a 2D difference array. Takes O(n^2 + k) time.
+    A demand (i, j), i < j, crosses exactly the cuts {g, h}, g < h, in the two rectangles i <= g < j <= h and
+    g < i <= h < j.
+    :param n: ring size
+    :param demands: list of non-zero demands
+    :return: SymmetricMatrix containing all demands across cuts
+    """
+    dtype = type(demands[0][2]) if len(demands) > 0 else np.float32
+    i, j, values = demand_list_to_arrays(demands)
+    acc_dtype = np.int64 if np.issubdtype(values.dtype, np.integer) else np.float64
+    values = values.astype(acc_dtype)
+
+    # rectangles [g_start, g_end) x [h_start, h_end) of crossed cuts
+    g_start = np.concatenate((i, np.zeros_like(i)))
+    g_end = np.concatenate((j, i))
+    h_start = np.concatenate((j, i))
+    h_end = np.concatenate((np.full_like(j, n), j))
+    values = np.concatenate((values, values))
+
+    diffs = np.zeros((n + 1, n + 1), dtype=acc_dtype)
+    np.add.at(diffs, (g_start, h_start), values)
+    np.add.at(diffs, (g_start, h_end), -values)
+    np.add.at(diffs, (g_end, h_start), -values)
+    np.add.at(diffs, (g_end, h_end), values)
+
+    D = np.cumsum(np.cumsum(diffs, axis=0), axis=1)[:n, :n]
+    D = np.triu(D, 1)
+    D += D.T
+    return SymmetricMatrix(n, initial_values=D.astype(dtype), check_symmetry=False)
+
+
+def compute_demands_across_cuts_naive(n, demands):
     """
     Computes all demands across cuts in the naive way. Takes O(k n^2) time.
+    Reference implementation of compute_demands_across_cuts.
     :param n: ring size
     :param demands: list of non-zero demands
     :return: SymmetricMatrix containing all demands across cuts
@@ -0,0 +1,90 @@
+import collections
+
+
+class ParallelDemandIndex:
+    """
+    Index over a shrinking set of demands that finds two parallel demands in O(1) time and removes demands in O(1)
+    time, after sorting the demands once in O(k log k) time.
+    Sort the demands (i, j), i < j, by (i, j). They are mutually crossing iff the second end nodes are strictly
+    increasing as well and the largest first end node is smaller than the smallest second end node. Otherwise, either
+    two neighbours in the sorted order are nested, or the first and the last demand are disjoint. Neighbours are kept
+    in a doubly linked list, and the set of nested neighbours is updated whenever a demand is removed.
+    """
+    def __init__(self, demands):
+        """
+        :param demands: list of demands in the form (i, j, d_{i, j})
+        """
+        self.demands = sorted(demands, key=lambda demand: (min(demand[:2]), max(demand[:2])))
+        self.first_nodes = [min(demand[:2]) for demand in self.demands]
+        self.second_nodes = [max(demand[:2]) for demand in self.demands]
+        # positions of each demand, of which there are several if the list contains the same demand more than once
+        self.positions = collections.defaultdict(list)
+        for position, demand in enumerate(self.demands):
+            self.positions[demand].append(position)
+
+        k = len(self.demands)
+        self.previous = list(range(-1, k - 1))
+        self.next = list(range(1, k + 1))
+        self.head = 0
+        self.tail = k - 1
+        self.size = k
+
+        # positions p such that the demands at p and next[p] are nested
+        self.nested = {p for p in range(k - 1) if self._nested(p, p + 1)}
+
+    def __len__(self):
+        return self.size
+
+    def to_list(self):
+        """
+        Returns the remaining demands in sorted order. Takes O(k) time.
+        :return: list of remaining demands
+        """
+        demands = []
+        p = self.head
+        for _ in range(self.size):
+            demands.append(self.demands[p])
+            p = self.next[p]
+        return demands
+
+    def find_parallel_demands(self):
+        """
+        Finds two parallel demands in O(1) time. Returns None if none exist.
+        :return: two parallel demands or None if none exist.
+        """
+        if len(self.nested) > 0:
+            p = next(iter(self.nested))
+            return self.demands[p], self.demands[self.next[p]]
+        if self.size > 1 and self.first_nodes[self.tail] >= self.second_nodes[self.head]:
+            return self.demands[self.head], self.demands[self.tail]
+        return None, None
+
+    def remove(self, demand):
+        """
+        Removes the given demand, or one copy of it if it is contained several times, in O(1) time.
+        :param demand: demand in the form (i, j, d_{i, j})
+        """
+        p = self.positions[demand].pop()
+        previous_position, next_position = self.previous[p], self.next[p]
+        self.nested.discard(p)
+        self.nested.discard(previous_position)
+
+        if previous_position >= 0:
+            self.next[previous_position] = next_position
+        else:
+            self.head = next_position
+        if next_position < len(self.demands):
+            self.previous[next_position] = previous_position
+        else:
+            self.tail = previous_position
+        self.size -= 1
+
+        if previous_position >= 0 and next_position < len(self.demands) \
+                and self._nested(previous_position, next_position):
+            self.nested.add(previous_position)
+
+    def _nested(self, p, q):
+        """
+        Checks whether the demand at q is nested in the one at p, given that p precedes q in the sorted order.
+        """
+        return self.first_nodes[p] == self.first_nodes[q] or self.second_nodes[q] <= self.second_nodes[p]
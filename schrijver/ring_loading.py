@@ -3,43 +3,58 @@ import numpy as np
 from capacities import compute_capacities
 from constants import FORWARD
 from schrijver.demands_across_cuts import compute_demands_across_cuts
+from schrijver.parallel_demand_index import ParallelDemandIndex
 from symmetric_matrix import SymmetricMatrix
 from utils.cut_utils import find_tight_cuts, determine_route_parallel_to_cut, demand_parallel_to_cut
 from utils.demand_utils import demands_are_parallel
 
 
-def ring_loading(n, demands):
+def ring_loading(n, demands, artifacts=None):
     """
     Computes a minimal solution of ring loading using Schrijver et al.'s algorithm.
     Runs in O(k * n^2), where k is the number of non-zero demands.
     :param n: ring size
     :param demands: list containing non-zero demands in the form (i, j, d_{i, j})
+    :param artifacts: dict of intermediate results 'demands_across_cuts', 'capacities' and 'tight_cuts' of an earlier
+    solve of the same instance. Results contained in it are reused, all others are added to it.
     :return: SymmetricMatrix containing a minimal solution
     """
-    demands_across_cuts = compute_demands_across_cuts(n, demands)
-    capacities = compute_capacities(n, demands_across_cuts)
-
-    pi_routing, capacities, demands = partial_integer_routing(n, demands, demands_across_cuts, capacities)
+    artifacts = {} if artifacts is None else artifacts
+    demands_across_cuts = artifacts.get('demands_across_cuts')
+    if demands_across_cuts is None and not ('capacities' in artifacts and 'tight_cuts' in artifacts):
+        demands_across_cuts = artifacts['demands_across_cuts'] = compute_demands_across_cuts(n, demands)
+    if 'capacities' not in artifacts:
+        artifacts['capacities'] = compute_capacities(n, demands_across_cuts)
+    if 'tight_cuts' not in artifacts:
+        artifacts['tight_cuts'] = find_tight_cuts(n, demands_across_cuts, artifacts['capacities'])
+
+    # the capacities are decreased while routing
+    capacities = artifacts['capacities'].copy()
+    pi_routing, capacities, demands = partial_integer_routing(n, demands, demands_across_cuts, capacities,
+                                                              artifacts['tight_cuts'])
 
     routing = split_route_crossing_demands(n, pi_routing, demands, capacities)
 
     return routing
 
 
-def partial_integer_routing(n, demands, demands_across_cuts, capacities):
+def partial_integer_routing(n, demands, demands_across_cuts, capacities, tight_cuts=None):
     """
     Computes a partial integer routing by routing parallel demands all front or all back until the remaining demands
-    are mutually crossing. Takes O(k n^2) time.
+    are mutually crossing. Takes O(k n^2) time, dominated by finding tight cuts; parallel demands are found in O(1).
     :param n:
     :param demands:
     :param demands_across_cuts:
     :param capacities:
+    :param tight_cuts: one tight cut for each link, found if None
     :return:
     """
-    tight_cuts = find_tight_cuts(n, demands_across_cuts, capacities)
+    if tight_cuts is None:
+        tight_cuts = find_tight_cuts(n, demands_across_cuts, capacities)
     routing = SymmetricMatrix(n)
+    index = ParallelDemandIndex(demands)
     while True:
-        demand1, demand2 = find_parallel_demands(demands)
+        demand1, demand2 = index.find_parallel_demands()
         if demand1 is None:
             break
         # sort demands and indices
@@ -54,39 +69,40 @@ def partial_integer_routing(n, demands, demands_across_cuts, capacities):
 
         g = find_edge_in_between((i, j), (k, l))
         h = tight_cuts[g]
-        routing, capacities, demands = _route_demand_if_parallel(capacities, routing, demands, (i, j), d_ij, (g, h))
-        routing, capacities, demands = _route_demand_if_parallel(capacities, routing, demands, (k, l), d_kl, (g, h))
+        routing, capacities = _route_demand_if_parallel(capacities, routing, index, demand1, (i, j), d_ij, (g, h))
+        routing, capacities = _route_demand_if_parallel(capacities, routing, index, demand2, (k, l), d_kl, (g, h))
 
-    return routing, capacities, demands
+    return routing, capacities, index.to_list()
 
 
-def _route_demand_if_parallel(capacities, routing, demands, indices, value, cut):
+def _route_demand_if_parallel(capacities, routing, index, demand, indices, value, cut):
     """
     Helper function that routes a demand parallel to the given cut if it is in fact parallel.
     :param capacities: edge capacities
     :param routing: current routing
-    :param demands: list of demands
-    :param indices: indices of demand to be routed
+    :param index: ParallelDemandIndex of remaining demands
+    :param demand: demand to be routed, as stored in the index
+    :param indices: sorted indices of demand to be routed
     :param value: value of demand to be routed
     :param cut: cut parallel to which the demand is to be routed
-    :return: new routing, new capacities, remaining demands
+    :return: new routing, new capacities
     """
     i, j = indices
     g, h = cut
     if demand_parallel_to_cut((i, j), (g, h)):
-        demands.remove((i, j, value))
+        index.remove(demand)
         routing[i, j] = determine_route_parallel_to_cut((i, j), (g, h))
         if routing[i, j] == FORWARD:
             capacities[i:j] -= value
         else:
             capacities[j:] -= value
             capacities[:i] -= value
-    return routing, capacities, demands
+    return routing, capacities
 
 
 def find_parallel_demands(demands):
     """
-    Finds two parallel demands. Returns None if none exist.
+    Finds two parallel demands in O(k^2) time. Returns None if none exist. See ParallelDemandIndex for a faster way.
     :param demands: list of demands
     :return: two parallel demands or None if none exist.
     """
@@ -0,0 +1,234 @@
+import collections
+import os
+import tempfile
+
+import numpy as np
+
+import proposed.ring_loading as proposed
+import schrijver.ring_loading as schrijver
+from instance_io import save_arrays, load_arrays
+from symmetric_matrix import PackedSymmetricMatrix
+from utils.demand_utils import demand_list_to_arrays, demands_digest
+
+# intermediate results shared by the solvers, see proposed.ring_loading.ring_loading
+ARTIFACTS = ['demands_across_cuts', 'capacities', 'tight_cuts']
+SOLVERS = ['proposed', 'schrijver']
+SUFFIX = '.rlc'
+
+
+class SolutionCache:
+    """
+    Content-addressed cache of solutions of ring loading and of the intermediate results of their solves, i.e. the
+    demands across cuts, capacities and tight cuts. Entries are keyed by the digest of the ring size, dtype and
+    non-zero demands of an instance, see utils.demand_utils.demands_digest, so an instance is found regardless of the
+    order of its demands and of whether it is given as a matrix or a list.
+    A solve missing the routing, e.g. because it was solved by the other solver before or its routing was evicted,
+    still reuses all intermediate results found.
+    Entries are kept in memory and, if a directory is given, on disk, where they are shared by all caches using the
+    same directory, e.g. across planning runs. Each tier evicts the least recently used entries once its entries
+    exceed its size.
+    """
+    def __init__(self, max_memory_bytes=2 ** 28, directory=None, max_disk_bytes=2 ** 32):
+        """
+        :param max_memory_bytes: maximal size of the arrays kept in memory
+        :param directory: directory to store entries in, or None to keep them in memory only
+        :param max_disk_bytes: maximal size of the files in directory
+        """
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+        # (digest, name) -> dict of np.arrays, least recently used first
+        self.entries = collections.OrderedDict()
+        self.memory_bytes = 0
+        self.counts = collections.Counter()
+
+    def ring_loading(self, n, demands, solver='proposed', integer=False):
+        """
+        Solves an instance unless its routing is cached, reusing all cached intermediate results of its solve.
+        :param n: ring size
+        :param demands: demands in the input format of the solver, i.e. a SymmetricMatrix for proposed and a list of
+        non-zero demands of type (i, j, d_{ij}) for schrijver
+        :param solver: name of the solver to use, one of SOLVERS
+        :param integer: whether to solve in integer mode, see proposed.ring_loading.ring_loading
+        :return: SymmetricMatrix containing a minimal solution
+        """
+        if solver not in SOLVERS:
+            raise Exception(f"Unknown solver {solver}!")
+        if integer and solver != 'proposed':
+            raise Exception(f"Solver {solver} has no integer mode!")
+        digest = instance_digest(n, demands, {'integer': integer})
+
+        routing = self.get(digest, f'{solver}_routing')
+        if routing is not None:
+            return routing
+
+        artifacts = {}
+        for name in ARTIFACTS:
+            value = self.get(digest, name)
+            if value is not None:
+                artifacts[name] = value
+        cached = set(artifacts)
+
+        if solver == 'proposed':
+            routing = proposed.ring_loading(n, demands, integer=integer, artifacts=artifacts)
+        else:
+            routing = schrijver.ring_loading(n, demands, artifacts=artifacts)
+
+        for name, value in artifacts.items():
+            if name not in cached:
+                self.put(digest, name, value)
+        self.put(digest, f'{solver}_routing', routing)
+        return routing
+
+    def get(self, digest, name):
+        """
+        Looks up an entry, first in memory and then on disk.
+        :param digest: digest of the instance
+        :param name: name of the entry, e.g. 'capacities' or 'proposed_routing'
+        :return: np.array, or SymmetricMatrix if the entry is a matrix, owned by the caller, or None if not cached
+        """
+        key = (digest, name)
+        arrays = self.entries.get(key)
+        if arrays is not None:
+            self.entries.move_to_end(key)
+            self.counts['memory_hits'] += 1
+            return _from_arrays(name, arrays)
+
+        path = self._path(digest, name)
+        if path is not None and os.path.exists(path):
+            try:
+                _, arrays, _ = load_arrays(path, mmap_mode=None)
+                # mark the file as recently used
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by another cache in the meantime
+                arrays = None
+            if arrays is not None:
+                self.counts['disk_hits'] += 1
+                self._keep_in_memory(key, arrays)
+                return _from_arrays(name, arrays)
+
+        self.counts['misses'] += 1
+        return None
+
+    def put(self, digest, name, value):
+        """
+        Stores an entry in memory and on disk.
+        :param digest: digest of the instance
+        :param name: name of the entry
+        :param value: np.array or SymmetricMatrix, which is copied
+        """
+        arrays = _to_arrays(name, value)
+        self._keep_in_memory((digest, name), arrays)
+
+        path = self._path(digest, name)
+        if path is not None:
+            # write to a temporary file first, so other caches never read partially written entries
+            fd, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            os.close(fd)
+            save_arrays(temporary_path, len(value), arrays)
+            os.replace(temporary_path, path)
+            self._evict_from_disk()
+
+    def stats(self):
+        """
+        :return: dict containing the numbers of memory hits, disk hits and misses and the size of each tier in bytes
+        """
+        disk_bytes = sum(size for _, size, _ in self._disk_entries()) if self.directory is not None else 0
+        return {
+            'memory_hits': self.counts['memory_hits'],
+            'disk_hits': self.counts['disk_hits'],
+            'misses': self.counts['misses'],
+            'memory_bytes': self.memory_bytes,
+            'disk_bytes': disk_bytes,
+        }
+
+    def _keep_in_memory(self, key, arrays):
+        size = _size(arrays)
+        if key in self.entries:
+            self.memory_bytes -= _size(self.entries.pop(key))
+        if size > self.max_memory_bytes:
+            return
+        self.entries[key] = arrays
+        self.memory_bytes += size
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_bytes -= _size(evicted)
+
+    def _path(self, digest, name):
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, f'{digest}_{name}{SUFFIX}')
+
+    def _disk_entries(self):
+        """
+        :return: list of tuples (path, size, time of last use) of all entries on disk
+        """
+        disk_entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                disk_entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return disk_entries
+
+    def _evict_from_disk(self):
+        disk_entries = sorted(self._disk_entries(), key=lambda disk_entry: disk_entry[2])
+        disk_bytes = sum(size for _, size, _ in disk_entries)
+        for path, size, _ in disk_entries:
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            disk_bytes -= size
+
+
+def instance_digest(n, demands, options=None):
+    """
+    Computes the digest of an instance given as a matrix or a list of demands, see
+    utils.demand_utils.demands_digest. Takes O(n^2) time for matrices and O(k log k) time for lists of k demands.
+    :param n: ring size
+    :param demands: SymmetricMatrix, PackedSymmetricMatrix or list of demands of type (i, j, d_{ij})
+    :param options: JSON-serializable dict of solver options that change the solution
+    :return: hex digest
+    """
+    if isinstance(demands, list):
+        first_nodes, second_nodes, values = demand_list_to_arrays(demands)
+    else:
+        demands = np.asarray(demands)
+        first_nodes, second_nodes = np.nonzero(np.triu(demands != 0, 1))
+        values = demands[first_nodes, second_nodes]
+    return demands_digest(n, first_nodes, second_nodes, values, options)
+
+
+def _to_arrays(name, value):
+    """
+    Converts an entry into the arrays stored, where symmetric matrices are stored as their packed triangle above the
+    main diagonal and their diagonal.
+    """
+    if _is_matrix(name):
+        packed = PackedSymmetricMatrix(len(value), initial_values=np.asarray(value), check_symmetry=False)
+        return {'values': packed.values, 'diagonal_values': packed.diagonal_values}
+    return {'values': np.array(value)}
+
+
+def _from_arrays(name, arrays):
+    if _is_matrix(name):
+        n = len(arrays['diagonal_values'])
+        return PackedSymmetricMatrix.from_packed(n, arrays['values'], arrays['diagonal_values']).to_dense()
+    return arrays['values'].copy()
+
+
+def _is_matrix(name):
+    return name == 'demands_across_cuts' or name.endswith('_routing')
+
+
+def _size(arrays):
+    return sum(array.nbytes for array in arrays.values())
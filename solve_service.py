@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import proposed.ring_loading as proposed
+from constants import FORWARD
+from proposed.residual_capacities import compute_link_loads
+from symmetric_matrix import SymmetricMatrix
+from utils.demand_utils import demand_list_to_arrays, demands_digest
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 422: 'Unprocessable Entity', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+PERCENTILES = [50, 90, 99]
+
+
+class ServiceOverloaded(Exception):
+    pass
+
+
+class SolverRejected(Exception):
+    """
+    Raised if the solver raised an exception for an instance, e.g. because no tight cut was found for a link.
+    """
+    pass
+
+
+class SolveService:
+    """
+    Local service solving ring loading instances with the proposed algorithm on a pool of worker processes, so that
+    other tools do not pay the startup of Python and NumPy for every instance.
+    It speaks a minimal subset of HTTP/1.1 over localhost TCP or a Unix socket:
+    - POST /solve with a JSON object containing the ring size "n", the non-zero demands "demands" as a list of
+      [i, j, d_{ij}] and optionally "integer", returns the routing as a list of [i, j, r_{ij}] in the order of the
+      demands, the maximal link load and the solver time. Malformed instances, e.g. with negative or non-finite
+      demands, are rejected with status 400, instances the solver fails on with status 422,
+    - GET /stats returns the number of requests, the queue depth and latency percentiles.
+    At most max_queue instances are solved or waiting for a worker at a time, further requests are rejected with
+    status 503. Requests for an instance that is already being solved wait for that solve instead of starting another
+    one.
+    """
+    def __init__(self, num_workers=None, max_queue=None, latency_window=10000):
+        """
+        :param num_workers: number of worker processes, defaults to the number of CPUs
+        :param max_queue: maximal number of instances being solved or waiting for a worker, defaults to
+        4 * num_workers
+        :param latency_window: number of most recent requests latency percentiles are computed over
+        """
+        self.num_workers = num_workers or os.cpu_count()
+        self.max_queue = max_queue or 4 * self.num_workers
+        # forked workers would inherit the sockets of open connections and keep them open after they are closed
+        self.executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                            mp_context=multiprocessing.get_context('forkserver'))
+
+        # digest of an instance -> future of its solution, for all instances currently being solved
+        self.in_flight = {}
+        self.latencies_ms = collections.deque(maxlen=latency_window)
+        self.counts = collections.Counter()
+
+    async def solve(self, n, demands, integer=False):
+        """
+        Solves an instance on the worker pool, coalescing it with an identical instance being solved.
+        :param n: ring size
+        :param demands: list of non-zero demands of type (i, j, d_{ij})
+        :param integer: whether to solve in integer mode, see proposed.ring_loading.ring_loading
+        :return: dict containing the routing, the maximal link load, the solver time and whether the request was
+        coalesced
+        """
+        first_nodes, second_nodes, values = demand_list_to_arrays(demands)
+        if len(values) > 0 and (np.min(first_nodes) < 0 or np.max(second_nodes) >= n):
+            raise ValueError("Demand end nodes must lie in [0, n)!")
+        if not np.all(np.isfinite(values)) or np.any(values < 0):
+            raise ValueError("Demands must be finite and non-negative!")
+        if integer and not np.all(values == np.round(values)):
+            raise ValueError("Integer mode requires integer demands!")
+        digest = demands_digest(n, first_nodes, second_nodes, values, {'integer': integer})
+
+        future = self.in_flight.get(digest)
+        coalesced = future is not None
+        if coalesced:
+            self.counts['coalesced'] += 1
+        else:
+            if len(self.in_flight) >= self.max_queue:
+                self.counts['rejected'] += 1
+                raise ServiceOverloaded()
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, _solve, n, first_nodes, second_nodes, values, integer)
+            self.in_flight[digest] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(digest, None))
+
+        try:
+            solved_first_nodes, solved_second_nodes, splits, max_load, time_ms = await asyncio.shield(future)
+        except BrokenProcessPool:
+            raise
+        except Exception as e:
+            raise SolverRejected(str(e)) from e
+        if coalesced:
+            # the demands of a coalesced request may be in another order
+            splits = _match_splits(n, solved_first_nodes, solved_second_nodes, splits, first_nodes, second_nodes)
+        routing = [[i, j, r] for i, j, r in zip(first_nodes.tolist(), second_nodes.tolist(), splits.tolist())]
+        return {'routing': routing, 'max_load': max_load, 'time_ms': time_ms, 'coalesced': coalesced}
+
+    def stats(self):
+        """
+        :return: dict containing request counts, the current queue depth and latency percentiles in ms
+        """
+        latencies = np.asarray(self.latencies_ms)
+        percentiles = np.percentile(latencies, PERCENTILES) if len(latencies) > 0 else [0] * len(PERCENTILES)
+        return {
+            'requests': self.counts['requests'],
+            'coalesced': self.counts['coalesced'],
+            'rejected': self.counts['rejected'],
+            'failed': self.counts['failed'],
+            'in_flight': len(self.in_flight),
+            'queue_depth': max(0, len(self.in_flight) - self.num_workers),
+            'max_queue': self.max_queue,
+            'latency_ms': {f'p{p}': float(value) for p, value in zip(PERCENTILES, percentiles)},
+        }
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serves HTTP requests on a connection until the client closes it.
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, response = await self._dispatch(method, target, body)
+                payload = json.dumps(response).encode()
+                writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                             f'Content-Length: {len(payload)}\r\n\r\n'.encode() + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, body):
+        if method == 'GET' and target == '/stats':
+            return 200, self.stats()
+        if method != 'POST' or target != '/solve':
+            return 404, {'error': f'Unknown endpoint {method} {target}'}
+
+        self.counts['requests'] += 1
+        time_start = time.perf_counter()
+        try:
+            request = json.loads(body)
+            response = await self.solve(request['n'], [tuple(demand) for demand in request['demands']],
+                                        bool(request.get('integer', False)))
+        except ServiceOverloaded:
+            return 503, {'error': 'Too many instances in flight, retry later'}
+        except SolverRejected as e:
+            self.counts['failed'] += 1
+            return 422, {'error': f'Solver failed on the instance: {e}'}
+        except (ValueError, KeyError, TypeError) as e:
+            self.counts['failed'] += 1
+            return 400, {'error': f'Invalid request: {e}'}
+        except Exception as e:
+            self.counts['failed'] += 1
+            return 500, {'error': str(e)}
+        self.latencies_ms.append((time.perf_counter() - time_start) * 1e3)
+        return 200, response
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_socket=None):
+        """
+        Serves requests until cancelled.
+        :param host: host to listen on if no Unix socket is given, localhost by default
+        :param port: port to listen on if no Unix socket is given
+        :param unix_socket: path of a Unix socket to listen on instead of TCP
+        """
+        if unix_socket is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def _solve(n, first_nodes, second_nodes, values, integer):
+    """
+    Worker function solving a single instance. The demands keep the dtype they were given in, i.e. int64 or float64
+    for JSON numbers, which the capacities follow.
+    :return: np.array containing the routing of each demand, maximal link load, time the solver took in milliseconds
+    """
+    demands = SymmetricMatrix(n, dtype=values.dtype)
+    demands[first_nodes, second_nodes] = values
+
+    time_start = time.time_ns()
+    routing = proposed.ring_loading(n, demands, integer=integer)
+    time_ms = (time.time_ns() - time_start) / 1e6
+
+    max_load = float(np.max(compute_link_loads(n, routing, demands), initial=0))
+    return first_nodes, second_nodes, np.asarray(routing)[first_nodes, second_nodes], max_load, time_ms
+
+
+def _match_splits(n, first_nodes, second_nodes, splits, query_first_nodes, query_second_nodes):
+    """
+    Looks up the routing of the demands (query_first_nodes, query_second_nodes) given the routing of the demands
+    (first_nodes, second_nodes). Demands not contained in the latter are zero and routed forward.
+    """
+    if len(first_nodes) == 0:
+        return np.full(len(query_first_nodes), FORWARD, dtype=np.float64)
+    keys = first_nodes * n + second_nodes
+    order = np.argsort(keys)
+    sorted_keys = keys[order]
+    query_keys = query_first_nodes * n + query_second_nodes
+    positions = np.minimum(np.searchsorted(sorted_keys, query_keys), len(keys) - 1)
+    found = sorted_keys[positions] == query_keys
+    return np.where(found, splits[order][positions], FORWARD).astype(np.float64)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the proposed ring loading solver over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix-socket', help='path of a Unix socket to listen on instead of TCP')
+    parser.add_argument('--workers', type=int, help='number of worker processes, defaults to the number of CPUs')
+    parser.add_argument('--max-queue', type=int, help='maximal number of instances in flight')
+    args = parser.parse_args()
+
+    service = SolveService(args.workers, args.max_queue)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
@@ -6,10 +6,10 @@ class SymmetricMatrix(np.ndarray):
     Custom implementation of a Symmetric Matrix that allows all numpy operations.
     Warning: Some operations are somewhat unsafe, like writing slices crossing the main diagonal.
     """
-    def __new__(cls, n, initial_values=None, dtype=np.float32, *args, **kwargs):
+    def __new__(cls, n, initial_values=None, dtype=np.float32, check_symmetry=True, *args, **kwargs):
         if initial_values is None:
             obj = np.zeros((n, n), dtype=dtype)
-        elif len(initial_values.shape) == 2 and np.allclose(initial_values, initial_values.T):
+        elif len(initial_values.shape) == 2 and (not check_symmetry or np.allclose(initial_values, initial_values.T)):
             obj = np.asarray(initial_values)
         else:
             raise Exception("Class SymmetricMatrix can only be initialized with a symmetric matrix!")
@@ -28,3 +28,152 @@ class SymmetricMatrix(np.ndarray):
         else:
             # Ideally cast to np.ndarray since obj is no square matrix anymore. But how?
             return
+
+
+class PackedSymmetricMatrix:
+    """
+    Symmetric Matrix that only stores the n(n-1)/2 entries above the main diagonal, packed row by row, and the n
+    entries on the main diagonal. Supports the same indexing as SymmetricMatrix, i.e. M[i, j] with integers, slices
+    and index arrays, where each entry is written once.
+    It is a storage format, used to store and transfer matrices in instance_io and solution_cache at half their size.
+    The solvers work on dense matrices: proposed.ring_loading.ring_loading unpacks packed demands once, and every
+    np.asarray unpacks the whole matrix again, so solving a packed instance does not take less memory. Only
+    capacities.compute_capacities reads packed demands across cuts row by row without unpacking them.
+    """
+    def __init__(self, n, initial_values=None, dtype=np.float32, check_symmetry=True):
+        if initial_values is None:
+            self.values = np.zeros(n * (n - 1) // 2, dtype=dtype)
+            self.diagonal_values = np.zeros(n, dtype=dtype)
+        elif len(initial_values.shape) == 2 and (not check_symmetry or np.allclose(initial_values, initial_values.T)):
+            initial_values = np.asarray(initial_values)
+            self.values = initial_values[np.triu_indices(n, 1)]
+            self.diagonal_values = np.diagonal(initial_values).copy()
+        else:
+            raise Exception("Class PackedSymmetricMatrix can only be initialized with a symmetric matrix!")
+        self.n = n
+
+    @classmethod
+    def from_packed(cls, n, values, diagonal_values=None):
+        """
+        Creates a PackedSymmetricMatrix from already packed entries without copying or validating them.
+        :param n: matrix size
+        :param values: np.array of the n(n-1)/2 entries above the main diagonal, packed row by row
+        :param diagonal_values: np.array of the n entries on the main diagonal, zero if None
+        :return: PackedSymmetricMatrix
+        """
+        assert len(values) == n * (n - 1) // 2
+        obj = cls.__new__(cls)
+        obj.n = n
+        obj.values = values
+        obj.diagonal_values = np.zeros(n, dtype=values.dtype) if diagonal_values is None else diagonal_values
+        return obj
+
+    @property
+    def shape(self):
+        return self.n, self.n
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def row_offset(self, i):
+        """
+        Returns the position of the entry (i, i+1) in the packed entries.
+        :param i: row index
+        :return: offset of row i
+        """
+        return i * self.n - i * (i + 1) // 2
+
+    def upper_row(self, i):
+        """
+        Returns a view of the entries (i, i+1), ..., (i, n-1), which are stored contiguously. Takes O(1) time.
+        :param i: row index
+        :return: np.array view of the entries right of the main diagonal in row i
+        """
+        offset = self.row_offset(i)
+        return self.values[offset:offset + self.n - i - 1]
+
+    def row(self, i):
+        """
+        Returns a copy of row i. Takes O(n) time.
+        :param i: row index
+        :return: np.array containing row i
+        """
+        row = np.empty(self.n, dtype=self.dtype)
+        # the entries (k, i), k < i, are found at offset(k) + i - k - 1
+        k = np.arange(i)
+        row[:i] = self.values[k * self.n - k * (k + 1) // 2 + i - k - 1]
+        row[i] = self.diagonal_values[i]
+        row[i + 1:] = self.upper_row(i)
+        return row
+
+    def column(self, j):
+        """
+        Returns a copy of column j, which equals row j. Takes O(n) time.
+        :param j: column index
+        :return: np.array containing column j
+        """
+        return self.row(j)
+
+    def to_dense(self):
+        """
+        Unpacks the matrix. Takes O(n^2) time and space.
+        :return: SymmetricMatrix containing the same entries
+        """
+        dense = np.empty((self.n, self.n), dtype=self.dtype)
+        upper_i, upper_j = np.triu_indices(self.n, 1)
+        dense[upper_i, upper_j] = self.values
+        dense[upper_j, upper_i] = self.values
+        np.fill_diagonal(dense, self.diagonal_values)
+        return SymmetricMatrix(self.n, initial_values=dense, check_symmetry=False)
+
+    def copy(self):
+        return PackedSymmetricMatrix.from_packed(self.n, self.values.copy(), self.diagonal_values.copy())
+
+    def max(self):
+        return max(np.max(self.values, initial=-np.inf), np.max(self.diagonal_values, initial=-np.inf))
+
+    def min(self):
+        return min(np.min(self.values, initial=np.inf), np.min(self.diagonal_values, initial=np.inf))
+
+    def __array__(self, dtype=None, copy=None):
+        dense = np.asarray(self.to_dense())
+        return dense if dtype is None else dense.astype(dtype)
+
+    def __getitem__(self, key):
+        packed_indices, on_diagonal, diagonal_indices = self._packed_indices(key)
+        result = np.empty(on_diagonal.shape, dtype=self.dtype)
+        result[~on_diagonal] = self.values[packed_indices[~on_diagonal]]
+        result[on_diagonal] = self.diagonal_values[diagonal_indices[on_diagonal]]
+        return result[()] if result.ndim == 0 else result
+
+    def __setitem__(self, key, value):
+        packed_indices, on_diagonal, diagonal_indices = self._packed_indices(key)
+        value = np.broadcast_to(value, on_diagonal.shape)
+        self.values[packed_indices[~on_diagonal]] = value[~on_diagonal]
+        self.diagonal_values[diagonal_indices[on_diagonal]] = value[on_diagonal]
+
+    def _packed_indices(self, key):
+        """
+        Translates a key (i, j) into positions in the packed entries. Slices in combination with another slice or an
+        index array select the outer product of the indices, as with np.ndarray.
+        :param key: tuple of integers, slices or index arrays
+        :return: np.array of positions above the diagonal, boolean np.array whether an entry lies on the diagonal,
+        np.array of positions on the diagonal
+        """
+        i, j = key
+        rows, columns = self._axis_indices(i), self._axis_indices(j)
+        if (isinstance(i, slice) and columns.ndim > 0) or (isinstance(j, slice) and rows.ndim > 0):
+            rows, columns = rows.reshape(rows.shape + (1,) * columns.ndim), columns
+        rows, columns = np.broadcast_arrays(rows, columns)
+
+        lower, upper = np.minimum(rows, columns), np.maximum(rows, columns)
+        on_diagonal = lower == upper
+        packed_indices = lower * self.n - lower * (lower + 1) // 2 + upper - lower - 1
+        return packed_indices, on_diagonal, lower
+
+    def _axis_indices(self, index):
+        if isinstance(index, slice):
+            return np.arange(self.n)[index]
+        index = np.asarray(index, dtype=int)
+        return np.where(index < 0, index + self.n, index)
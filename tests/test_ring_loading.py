@@ -0,0 +1,529 @@
+import asyncio
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import batch_solve
+import instance_io
+import proposed.ring_loading as proposed
+import proposed.sparse_ring_loading as sparse
+import proposed.incremental_ring_loading as incremental
+import proposed.stacked_ring_loading as stacked
+import schrijver.demands_across_cuts as schrijver_demands_across_cuts
+import schrijver.ring_loading as schrijver
+from schrijver.parallel_demand_index import ParallelDemandIndex
+import solve_service
+from solution_cache import SolutionCache, instance_digest
+from capacities import compute_capacities
+from constants import UNROUTED, FORWARD, BACKWARD
+from generate_instance import generate_instance, demands_to_list
+from proposed.contract_instance import contract_capacities, contract_capacities_sequential, contract_instance
+from proposed.demands_across_cuts import compute_demands_across_cuts, compute_demands_across_cuts_recursive, \
+    compute_stacked_demands_across_cuts, compute_tiled_demands_across_cuts, compute_contracted_demands_across_cuts
+from proposed.residual_capacities import compute_link_loads, compute_link_loads_from_list, \
+    compute_link_loads_recursive, compute_directional_link_loads
+from symmetric_matrix import SymmetricMatrix, PackedSymmetricMatrix
+from utils.backends import BACKENDS
+from utils.cut_utils import find_tight_cuts, tight_cut_index, TIE_BREAKS, FLOAT64_TOLERANCE
+from utils.demand_utils import demand_list_to_arrays, find_unrouted_demands, find_unrouted_demands_sequential
+from utils.instrumentation import Instrumentation, NO_INSTRUMENTATION
+from utils.sanity_checks import verify_routing
+
+SIZES = [2, 5, 8, 13, 21]
+SEEDS = range(3)
+
+
+def max_load(n, demands, routing):
+    return np.max(compute_link_loads(n, routing, demands), initial=0)
+
+
+def random_demands(n, seed, dtype):
+    """
+    :return: SymmetricMatrix of random demands of the given dtype with about a third of them zero
+    """
+    integer = np.issubdtype(dtype, np.integer)
+    return generate_instance(n, sparsity=0.3, integer=integer, seed=seed).astype(dtype)
+
+
+def assert_matches(actual, expected):
+    """
+    Asserts that results are equal, up to rounding for floating point results.
+    """
+    actual, expected = np.asarray(actual), np.asarray(expected)
+    if np.issubdtype(actual.dtype, np.inexact) or np.issubdtype(expected.dtype, np.inexact):
+        np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-3)
+    else:
+        np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('dtype', [np.int64, np.float32])
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_demands_across_cuts_match_recursion(n, seed, dtype, backend):
+    demands = random_demands(n, seed, dtype)
+    expected = compute_demands_across_cuts_recursive(n, demands)
+
+    stacked = compute_stacked_demands_across_cuts(n, np.asarray(demands)[None], backend=backend)[0]
+    assert stacked.dtype == dtype
+    assert_matches(stacked, expected)
+    assert_matches(compute_tiled_demands_across_cuts(n, demands, num_threads=2, tile_size=3), expected)
+
+
+# Schrijver's split routing ignores the cuts consisting of a single link, which leaves the only demand of a ring of
+# size 2 unsplit
+@pytest.mark.parametrize('n', SIZES[1:])
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('dtype', [np.int64, np.float32, np.float64])
+def test_schrijver_matches_proposed(n, seed, dtype):
+    demands = generate_instance(n, sparsity=0.3, integer=dtype == np.int64, seed=seed).astype(dtype)
+    demand_list = demands_to_list(n, demands, seed)
+    assert all(np.asarray(d).dtype == dtype for _, _, d in demand_list)
+
+    expected = max_load(n, demands, proposed.ring_loading(n, demands))
+    assert max_load(n, demands, schrijver.ring_loading(n, demand_list)) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('integer', [True, False])
+def test_sparse_ring_loading_of_generated_list(n, seed, integer):
+    demands = generate_instance(n, sparsity=0.5, integer=integer, seed=seed)
+    demand_list = generate_instance(n, sparsity=0.5, integer=integer, seed=seed, sparse=True)
+
+    routing = sparse.ring_loading(n, demand_list)
+    first_nodes, second_nodes, values = demand_list_to_arrays(demand_list)
+    splits = np.array([r for _, _, r in routing])
+    sparse_max_load = np.max(compute_link_loads_from_list(n, first_nodes, second_nodes, values, splits), initial=0)
+
+    assert sparse_max_load == pytest.approx(max_load(n, demands, proposed.ring_loading(n, demands)))
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_capacities_have_dtype_of_demands_across_cuts(dtype):
+    n = 13
+    demands = generate_instance(n, seed=1).astype(dtype)
+    demands_across_cuts = compute_demands_across_cuts(n, demands)
+    assert compute_capacities(n, demands_across_cuts).dtype == dtype
+
+
+def random_routing(n, seed):
+    """
+    :return: SymmetricMatrix of a random partial routing containing unrouted demands, demands routed forward and
+    backward and split demands
+    """
+    rng = np.random.default_rng(seed)
+    routing = rng.choice([UNROUTED, FORWARD, BACKWARD], size=(n, n)).astype(np.float64)
+    routing = np.triu(np.where(rng.random((n, n)) < 0.25, rng.random((n, n)), routing), 1)
+    return SymmetricMatrix(n, initial_values=routing + routing.T, check_symmetry=False)
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('dtype', [np.int64, np.float32])
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_link_loads_match_recursion(n, seed, dtype, backend):
+    demands = random_demands(n, seed, dtype)
+    routing = random_routing(n, seed)
+    forward_loads, backward_loads = compute_directional_link_loads(n, routing, demands, backend=backend)
+    assert_matches(forward_loads + backward_loads, compute_link_loads_recursive(n, routing, demands))
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('tie_break', TIE_BREAKS)
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_parallel_routing_matches_sequential(n, seed, tie_break, backend):
+    demands = random_demands(n, seed, np.int64)
+    demands_across_cuts = compute_demands_across_cuts(n, demands)
+    tight_cuts = find_tight_cuts(n, demands_across_cuts, compute_capacities(n, demands_across_cuts),
+                                 tie_break=tie_break, seed=seed)
+
+    routing = proposed.route_stacked_parallel_demands(n, tight_cuts[None], backend=backend)[0]
+    assert_matches(routing, proposed.route_parallel_demands_sequential(n, tight_cuts))
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+def test_unrouted_demands_match_sequential(n, seed):
+    routing = proposed.partial_integer_routing(n, random_demands(n, seed, np.float32))[0]
+    assert find_unrouted_demands(n, routing) == find_unrouted_demands_sequential(n, routing)
+
+
+@pytest.mark.parametrize('n', SIZES + [34, 55])
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('tie_break', TIE_BREAKS)
+def test_tight_cut_options_of_ring_loading(n, seed, tie_break):
+    demands = generate_instance(n, sparsity=0.3, integer=False, seed=seed)
+    expected = max_load(n, demands, proposed.ring_loading(n, demands))
+
+    instrumentation = Instrumentation()
+    routing = proposed.ring_loading(n, demands, instrumentation, tie_break=tie_break, seed=seed)
+    certificate = verify_routing(n, demands, routing)
+    assert certificate.complete and certificate.optimal
+
+    demands_across_cuts = compute_demands_across_cuts(n, demands)
+    indptr, indices = tight_cut_index(n, demands_across_cuts, compute_capacities(n, demands_across_cuts),
+                                      FLOAT64_TOLERANCE)
+    tight_cuts = {(i, j) for i in range(n) for j in indices[indptr[i]:indptr[i + 1]] if i < j}
+    assert instrumentation.stats.sizes['tight_cuts'] == len(tight_cuts)
+
+    demand_list = demands_to_list(n, demands, seed)
+    routing = sparse.ring_loading(n, demand_list, tie_break=tie_break, seed=seed)
+    first_nodes, second_nodes, values = demand_list_to_arrays(demand_list)
+    splits = np.array([r for _, _, r in routing])
+    assert np.all((0 <= splits) & (splits <= 1))
+    sparse_max_load = np.max(compute_link_loads_from_list(n, first_nodes, second_nodes, values, splits), initial=0)
+    assert sparse_max_load == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_parallel_demand_index_matches_list(seed):
+    rng = np.random.default_rng(seed)
+    demand_list = [(i, j, 1) for i, j in (rng.choice(8, 2, replace=False) for _ in range(12))]
+    # the same demand several times
+    demand_list += demand_list[:4]
+    index = ParallelDemandIndex(demand_list)
+    remaining = list(demand_list)
+    while len(remaining) > 0:
+        demand1, demand2 = index.find_parallel_demands()
+        assert (demand1 is None) == (schrijver.find_parallel_demands(remaining)[0] is None)
+        demand = demand1 if demand1 is not None else remaining[0]
+        index.remove(demand)
+        remaining.remove(demand)
+        assert len(index) == len(remaining)
+        assert sorted(index.to_list()) == sorted(remaining)
+
+
+def test_disabled_instrumentation_takes_no_hooks():
+    with pytest.raises(Exception, match='disabled'):
+        NO_INSTRUMENTATION.subscribe(print)
+    assert NO_INSTRUMENTATION.hooks == []
+
+    events = []
+    instrumentation = Instrumentation()
+    instrumentation.subscribe(lambda event, name, value: events.append((event, name)))
+    proposed.ring_loading(8, random_demands(8, 0, np.float64), instrumentation)
+    assert ('phase_end', 'demands_across_cuts') in events and ('size', 'tight_cuts') in events
+
+
+@pytest.mark.parametrize('n', SIZES[1:])
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('dtype', [np.int64, np.float32])
+def test_schrijver_demands_across_cuts_match_naive(n, seed, dtype):
+    demand_list = demands_to_list(n, random_demands(n, seed, dtype), seed)
+    D = schrijver_demands_across_cuts.compute_demands_across_cuts(n, demand_list)
+    assert D.dtype == dtype
+    assert_matches(D, schrijver_demands_across_cuts.compute_demands_across_cuts_naive(n, demand_list))
+
+
+def random_crossing_demands(n, seed):
+    """
+    :return: sorted list of random mutually crossing demands (i, j), i < j, i.e. the k-th of 2m distinct nodes paired
+    with the (k + m)-th
+    """
+    rng = np.random.default_rng(seed)
+    m = rng.integers(1, n // 2 + 1)
+    nodes = np.sort(rng.choice(n, 2 * m, replace=False)).tolist()
+    return list(zip(nodes[:m], nodes[m:]))
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+# residual capacities are floating point, since the link loads subtracted from the capacities are float64
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_contraction_matches_sequential(n, seed, dtype):
+    S = random_crossing_demands(n, seed)
+    residual_capacities = (np.random.default_rng(seed).random(n) * 100).astype(dtype)
+    expected = contract_capacities_sequential(n, S, residual_capacities)
+    contracted_capacities = contract_capacities(n, S, residual_capacities)
+    assert contracted_capacities.dtype == expected.dtype
+    assert_matches(contracted_capacities, expected)
+
+
+@pytest.mark.parametrize('m', [2, 4, 6, 10])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_contracted_demands_across_cuts_match_dense(m, seed):
+    contracted_demands = np.random.default_rng(seed).random(m // 2) * 100
+    demands = SymmetricMatrix(m, dtype=np.float64)
+    demands[np.arange(m // 2), np.arange(m // 2) + m // 2] = contracted_demands
+    assert_matches(compute_contracted_demands_across_cuts(m, contracted_demands),
+                   compute_demands_across_cuts_recursive(m, demands))
+
+
+@pytest.mark.parametrize('n', SIZES[1:])
+@pytest.mark.parametrize('dtype', [np.int64, np.float32])
+def test_split_routing_matches_sequential(n, dtype):
+    contracted = 0
+    for seed in range(20):
+        demands = random_demands(n, seed, dtype)
+        routing, S, capacities, _, _ = proposed.partial_integer_routing(n, demands)
+        S = [(i, j) for i, j in S if demands[i, j] > 0]
+        if len(S) == 0:
+            continue
+        contracted += 1
+        m, contracted_demands, contracted_capacities = contract_instance(n, routing, S, demands, capacities)
+
+        splits = proposed.split_route_contracted_instance(m, contracted_demands, contracted_capacities.copy())
+        expected = proposed.split_route_contracted_instance_sequential(m, contracted_demands,
+                                                                       contracted_capacities.copy())
+        assert_matches(splits, expected)
+    assert contracted > 0
+
+
+@pytest.mark.parametrize('n', [13, 21, 34, 55])
+@pytest.mark.parametrize('sparsity', [0, 0.5])
+def test_float64_routing_is_complete_and_optimal(n, sparsity):
+    # rounding leaves slightly negative cut slacks in the split routing, which must not give negative splits
+    for seed in range(20):
+        demands = generate_instance(n, sparsity=sparsity, integer=False, seed=seed)
+        certificate = verify_routing(n, demands, proposed.ring_loading(n, demands))
+        assert certificate.complete and certificate.optimal
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('dtype', [np.int64, np.float32, np.float64])
+def test_stacked_ring_loading_matches_ring_loading(n, dtype):
+    demands = np.stack([random_demands(n, seed, dtype) for seed in range(10)])
+    routings = stacked.ring_loading(n, demands)
+    for b in range(len(demands)):
+        assert_matches(routings[b], proposed.ring_loading(n, SymmetricMatrix(n, initial_values=demands[b])))
+        certificate = verify_routing(n, demands[b], routings[b])
+        assert certificate.complete and certificate.optimal
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('dtype', [np.int64, np.float64])
+def test_incremental_ring_loading_matches_ring_loading(n, seed, dtype):
+    demands = random_demands(n, seed, dtype)
+    solver = incremental.IncrementalRingLoading(n, demands)
+    rng = np.random.default_rng(seed)
+    # enough updates to pass a refresh of the float state
+    for _ in range(2 * incremental.REFRESH_INTERVAL):
+        i, j = rng.choice(n, 2, replace=False)
+        demands[i, j] = 0 if rng.random() < 0.2 else rng.integers(1, 100) if dtype == np.int64 else rng.random() * 100
+        solver.update_demand(i, j, demands[i, j])
+
+        routing = solver.solve()
+        certificate = verify_routing(n, demands, routing)
+        assert certificate.complete and certificate.optimal
+        assert max_load(n, demands, routing) == pytest.approx(max_load(n, demands, proposed.ring_loading(n, demands)))
+
+
+def test_incremental_ring_loading_rejects_fractional_integer_demands():
+    solver = incremental.IncrementalRingLoading(5, random_demands(5, 0, np.int64))
+    with pytest.raises(Exception, match='not representable'):
+        solver.update_demand(1, 3, 1.5)
+    solver.update_demand(1, 3, 2.0)
+    assert solver.demands[1, 3] == 2
+
+
+@pytest.mark.parametrize('n', SIZES)
+@pytest.mark.parametrize('dtype', [np.int64, np.float32])
+def test_packed_matrix_matches_dense(n, dtype):
+    demands = random_demands(n, 1, dtype)
+    packed = PackedSymmetricMatrix(n, initial_values=demands)
+    assert packed.values.nbytes == n * (n - 1) // 2 * demands.itemsize
+    for i in range(n):
+        assert_matches(packed.row(i), demands[i])
+    assert_matches(packed[1:, :2], demands[1:, :2])
+    assert_matches(packed.to_dense(), demands)
+    assert_matches(proposed.ring_loading(n, packed), proposed.ring_loading(n, demands))
+
+
+def write_jsonl(path, records):
+    with open(path, 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_solution_cache_hits_and_evicts():
+    n = 13
+    demands = [random_demands(n, seed, np.float64) for seed in range(2)]
+    cache = SolutionCache()
+
+    routing = cache.ring_loading(n, demands[0])
+    assert_matches(routing, proposed.ring_loading(n, demands[0]))
+    assert_matches(cache.ring_loading(n, demands[0]), routing)
+    assert cache.stats()['memory_hits'] == 1
+
+    # leave room for the entries of one instance only
+    cache.max_memory_bytes = cache.stats()['memory_bytes']
+
+    cache.ring_loading(n, demands[1])
+    assert cache.stats()['memory_bytes'] <= cache.max_memory_bytes
+    misses = cache.stats()['misses']
+    assert cache.get(instance_digest(n, demands[0], {'integer': False}), 'proposed_routing') is None
+    assert cache.stats()['misses'] == misses + 1
+    assert_matches(cache.ring_loading(n, demands[0]), routing)
+
+
+def test_solution_cache_reloads_from_disk(tmp_path, monkeypatch):
+    n = 13
+    demands = random_demands(n, 0, np.float64)
+    routing = SolutionCache(directory=str(tmp_path)).ring_loading(n, demands)
+
+    # a new cache finds the routing on disk without solving
+    monkeypatch.setattr(proposed, 'ring_loading', None)
+    cache = SolutionCache(directory=str(tmp_path))
+    assert_matches(cache.ring_loading(n, demands), routing)
+    assert cache.stats()['disk_hits'] == 1 and cache.stats()['misses'] == 0
+    assert cache.stats()['disk_bytes'] > 0
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_solution_cache_reuses_artifacts_across_solvers(seed):
+    n = 13
+    demands = random_demands(n, seed, np.float64)
+    cache = SolutionCache()
+    cache.ring_loading(n, demands_to_list(n, demands, seed), solver='schrijver')
+
+    # the routing of proposed misses, all intermediate results hit
+    routing = cache.ring_loading(n, demands)
+    assert cache.stats()['memory_hits'] == 3
+    assert_matches(routing, proposed.ring_loading(n, demands))
+    certificate = verify_routing(n, demands, routing)
+    assert certificate.complete and certificate.optimal
+
+
+def assert_aligned(path):
+    with open(path, 'rb') as f:
+        f.seek(len(instance_io.MAGIC))
+        header_length, = struct.unpack('<Q', f.read(8))
+    data_offset = instance_io._data_offset(header_length)
+    for description in instance_io.read_header(path)['arrays'].values():
+        assert (data_offset + description['offset']) % instance_io.ALIGNMENT == 0
+
+
+def assert_loaded(array, mmap_mode):
+    assert isinstance(array, np.memmap) == (mmap_mode is not None and array.size > 0)
+
+
+@pytest.mark.parametrize('mmap_mode', ['r', None])
+@pytest.mark.parametrize('dtype', [np.int64, np.float32])
+def test_instance_io_round_trip(tmp_path, mmap_mode, dtype):
+    n = 13
+    demands = random_demands(n, 0, dtype)
+
+    path = str(tmp_path / 'packed.bin')
+    instance_io.save_instance(path, n, demands, metadata={'seed': 0})
+    loaded_n, packed, metadata = instance_io.load_instance(path, mmap_mode)
+    assert (loaded_n, metadata) == (n, {'seed': 0})
+    assert isinstance(packed, PackedSymmetricMatrix) and packed.dtype == dtype
+    assert_loaded(packed.values, mmap_mode)
+    np.testing.assert_array_equal(packed.to_dense(), demands)
+    assert_aligned(path)
+
+    path = str(tmp_path / 'sparse.bin')
+    demand_list = demands_to_list(n, demands, 0)
+    instance_io.save_instance(path, n, demand_list)
+    _, arrays, _ = instance_io.load_instance(path, mmap_mode)
+    for array, expected in zip(arrays, demand_list_to_arrays(demand_list)):
+        assert_loaded(array, mmap_mode)
+        np.testing.assert_array_equal(array, expected)
+    assert arrays[2].dtype == dtype
+    assert_aligned(path)
+
+    path = str(tmp_path / 'raw.bin')
+    saved = {'demands_across_cuts': compute_demands_across_cuts(n, demands), 'tight_cuts': np.arange(n),
+             'empty': np.zeros((0, 3), dtype=dtype)}
+    instance_io.save_arrays(path, n, saved)
+    _, arrays, _ = instance_io.load_arrays(path, mmap_mode)
+    assert set(arrays) == set(saved)
+    for name, array in arrays.items():
+        assert_loaded(array, mmap_mode)
+        assert array.dtype == saved[name].dtype and array.shape == saved[name].shape
+        np.testing.assert_array_equal(array, saved[name])
+    assert_aligned(path)
+
+
+def test_batch_run_records_failed_instances(tmp_path):
+    instances = [{'id': f'int{seed}', 'n': 8,
+                  'demands': [[i, j, int(d)] for i, j, d in generate_instance(8, integer=True, seed=seed, sparse=True)]}
+                 for seed in range(3)]
+    # no capacities exist for NaN demands
+    instances.insert(1, {'id': 'nan', 'n': 4, 'demands': [[0, 2, float('nan')], [1, 3, 1.0]]})
+    paths = [str(tmp_path / 'instances.jsonl')]
+    write_jsonl(paths[0], instances)
+    output = str(tmp_path / 'results.jsonl')
+
+    assert batch_solve.run(paths, output, num_workers=2) == 3
+    records = {record['id']: record for record in read_jsonl(output)}
+    assert set(records) == {'int0', 'int1', 'int2', 'nan'}
+    assert 'error' in records['nan'] and 'max_load' in records['int2']
+
+    # resuming skips all instances, also the failed one, unless failed ones are retried
+    assert batch_solve.run(paths, output, num_workers=2) == 0
+    batch_solve.run(paths, output, num_workers=2, retry_failed=True)
+    assert [record['id'] for record in read_jsonl(output)].count('nan') == 2
+
+
+def test_failed_worker_closes_shared_memory(monkeypatch):
+    demands = np.full((4, 4), np.nan)
+    np.fill_diagonal(demands, 0)
+    demands_block = batch_solve._to_shared_memory(demands)
+    routing_block = batch_solve._to_shared_memory(np.zeros((4, 4)))
+    closed = []
+    shared_memory_class = batch_solve.shared_memory.SharedMemory
+    close = shared_memory_class.close
+    monkeypatch.setattr(shared_memory_class, 'close', lambda block: closed.append(block) or close(block))
+    # only count explicit closes, not those of garbage collected blocks
+    monkeypatch.setattr(shared_memory_class, '__del__', lambda block: None)
+    try:
+        with pytest.raises(Exception):
+            batch_solve._solve_shared('proposed', 4, demands_block.name, demands.dtype, routing_block.name)
+        assert len(closed) == 2
+    finally:
+        monkeypatch.undo()
+        batch_solve._release(demands_block)
+        batch_solve._release(routing_block)
+
+
+@pytest.mark.parametrize('integer', [True, False])
+def test_batch_solve_of_jsonl_instances(tmp_path, integer):
+    instances = []
+    for seed in SEEDS:
+        demand_list = generate_instance(13, sparsity=0.5, integer=integer, seed=seed, sparse=True)
+        # as written by other tools, i.e. with Python numbers
+        instances.append({'id': str(seed), 'n': 13, 'demands': [[i, j, d.item()] for i, j, d in demand_list]})
+    write_jsonl(tmp_path / 'instances.jsonl', instances)
+
+    read = list(batch_solve.read_instances([str(tmp_path / 'instances.jsonl')]))
+    results = sorted(batch_solve.solve_batch([(n, demands) for _, n, demands in read], num_workers=2))
+    for (_, n, demands), result in zip(read, results):
+        assert result.error is None
+        assert result.max_load == pytest.approx(max_load(n, demands, proposed.ring_loading(n, demands)))
+
+
+def test_solve_service_statuses():
+    float_demands = [[i, j, d.item()] for i, j, d in generate_instance(9, sparsity=0.5, seed=1, sparse=True)]
+    requests = [
+        ({'n': 9, 'demands': float_demands}, 200),
+        ({'n': 5, 'demands': [[0, 2, 3], [1, 3, 2]], 'integer': True}, 200),
+        ({'n': 5, 'demands': [[0, 2, 1.5]], 'integer': True}, 400),
+        ({'n': 5, 'demands': [[0, 2, -1.0]]}, 400),
+        ({'n': 5, 'demands': [[0, 2, float('nan')]]}, 400),
+        ({'n': 5, 'demands': [[0, 7, 1.0]]}, 400),
+    ]
+
+    async def dispatch_all():
+        service = solve_service.SolveService(num_workers=1)
+        try:
+            return [await service._dispatch('POST', '/solve', json.dumps(request).encode()) for request, _ in requests]
+        finally:
+            service.executor.shutdown()
+
+    responses = asyncio.run(dispatch_all())
+    assert [status for status, _ in responses] == [status for _, status in requests]
+
+    n, demands = 9, generate_instance(9, sparsity=0.5, seed=1)
+    expected = max_load(n, demands, proposed.ring_loading(n, demands))
+    assert responses[0][1]['max_load'] == pytest.approx(expected)
@@ -0,0 +1,142 @@
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMPY = 'numpy'
+NUMBA = 'numba'
+BACKENDS = (NUMPY, NUMBA)
+
+# kernel name -> backend -> implementation
+_kernels = {}
+
+_settings = {
+    # backend used by all kernels unless a call asks for another one
+    'backend': os.environ.get('RING_LOADING_BACKEND', NUMBA if numba is not None else NUMPY),
+    # whether every kernel call runs all available backends and compares their results
+    'cross_check': os.environ.get('RING_LOADING_CROSS_CHECK', '0') == '1',
+}
+
+
+def kernel(name, backend=NUMPY):
+    """
+    Decorator registering a function as the implementation of a kernel for the given backend. Implementations for the
+    numba backend are compiled with Numba and only registered if Numba is installed. The decorated function itself is
+    returned unchanged.
+    All implementations of a kernel must take the same arguments and have the same effect, i.e. return the same
+    result and write the same values into arrays passed to them.
+    :param name: name of the kernel
+    :param backend: backend the function implements the kernel for
+    :return: decorator
+    """
+    _check_backend(backend)
+
+    def register(function):
+        if backend == NUMBA:
+            if numba is not None:
+                _kernels.setdefault(name, {})[backend] = numba.njit(cache=True)(function)
+        else:
+            _kernels.setdefault(name, {})[backend] = function
+        return function
+
+    return register
+
+
+def set_backend(backend):
+    """
+    Sets the backend used by all kernels that do not ask for another one. Kernels without an implementation for the
+    backend, e.g. because Numba is not installed, fall back to numpy.
+    :param backend: 'numpy' or 'numba'
+    """
+    _check_backend(backend)
+    _settings['backend'] = backend
+
+
+def get_backend():
+    return _settings['backend']
+
+
+def set_cross_check(enabled):
+    """
+    Enables or disables cross-checking. If enabled, every kernel call additionally runs all other available
+    implementations of the kernel on copies of its arguments and raises an exception if their results differ. This
+    is meant for testing, since it runs every kernel several times.
+    :param enabled: whether to cross-check backends
+    """
+    _settings['cross_check'] = enabled
+
+
+def get_kernel(name, backend=None):
+    """
+    Returns the implementation of a kernel for the given backend, falling back to numpy if there is none.
+    :param name: name of the kernel
+    :param backend: 'numpy', 'numba' or None for the backend set by set_backend
+    :return: callable implementing the kernel
+    """
+    if name not in _kernels:
+        raise Exception(f"Unknown kernel {name}!")
+    backend = backend or _settings['backend']
+    _check_backend(backend)
+    implementations = _kernels[name]
+    return implementations.get(backend, implementations[NUMPY])
+
+
+def available_backends(name):
+    """
+    :param name: name of the kernel
+    :return: list of backends the kernel is implemented for
+    """
+    return [backend for backend in BACKENDS if backend in _kernels.get(name, {})]
+
+
+def call_kernel(name, *args, backend=None):
+    """
+    Calls a kernel using the given backend, cross-checking all available backends if enabled.
+    :param name: name of the kernel
+    :param args: arguments passed to the kernel
+    :param backend: 'numpy', 'numba' or None for the backend set by set_backend
+    :return: result of the kernel
+    """
+    implementation = get_kernel(name, backend)
+    if not _settings['cross_check']:
+        return implementation(*args)
+
+    # run the others on copies first, since the chosen implementation may write into the arguments
+    other_runs = []
+    for other_backend, other_implementation in _kernels[name].items():
+        if other_implementation is not implementation:
+            copied_args = [np.copy(arg) if isinstance(arg, np.ndarray) else arg for arg in args]
+            other_runs.append((other_backend, other_implementation(*copied_args), copied_args))
+
+    result = implementation(*args)
+    for other_backend, other_result, other_args in other_runs:
+        if not _results_match(result, other_result) or not _results_match(list(args), other_args):
+            raise Exception(f"Backends {backend or _settings['backend']} and {other_backend} disagree on kernel "
+                            f"{name}!")
+    return result
+
+
+def _results_match(a, b):
+    """
+    Compares results of two kernel implementations. Integer results must be equal, floating point results may differ
+    by rounding, since implementations may sum in different order.
+    """
+    if isinstance(a, (tuple, list)):
+        return len(a) == len(b) and all(_results_match(x, y) for x, y in zip(a, b))
+    if isinstance(a, np.ndarray) or isinstance(b, np.ndarray):
+        a, b = np.asarray(a), np.asarray(b)
+        if a.shape != b.shape:
+            return False
+        if np.issubdtype(a.dtype, np.inexact) or np.issubdtype(b.dtype, np.inexact):
+            return np.allclose(a, b, rtol=1e-6, atol=1e-6, equal_nan=True)
+        return np.array_equal(a, b)
+    return a == b
+
+
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise Exception(f"Unknown backend {backend}!")
@@ -1,6 +1,7 @@
 import numpy as np
 
 from constants import FORWARD, BACKWARD
+from utils.backends import kernel, call_kernel, NUMBA
 
 
 def demand_crosses_cut(demand, cut):
@@ -19,23 +20,295 @@ def demand_parallel_to_cut(demand, cut):
     return not demand_crosses_cut(demand, cut)
 
 
-def find_tight_cuts(n, demands_across_cuts, capacities):
+def demands_parallel_to_cut(first_nodes, second_nodes, cut):
     """
-    A O(n^2) algorithm for finding one tight cut for each link.
-    :param n:
-    :param demands_across_cuts:
-    :param capacities:
-    :return:
+    Vectorized version of demand_parallel_to_cut.
+    :param first_nodes: np.array of first end nodes of the demands
+    :param second_nodes: np.array of second end nodes of the demands
+    :param cut: tuple of indices of the cut
+    :return: boolean np.array, whether the demands are parallel to the given cut
     """
-    tight_cuts = np.zeros((n,), dtype=np.int)
-    for i in range(n):
-        j = np.equal(capacities + capacities[i], demands_across_cuts[i, :]).nonzero()[0]
-        # there might be multiple tight cuts, choose any
-        j = j[np.random.randint(0, len(j))]
-        tight_cuts[i] = j
+    g, h = min(cut), max(cut)
+    # a demand is parallel to the cut iff both or none of its end nodes lie in {g+1, ..., h}
+    return ((g < first_nodes) & (first_nodes <= h)) == ((g < second_nodes) & (second_nodes <= h))
+
+
+def next_crossing_demands(n, nodes, starts, cut):
+    """
+    For every node i in nodes, finds the first node j, circularly scanning from the corresponding start in starts
+    towards i, such that the demand (i, j) crosses the given cut. If no such node exists, j = i.
+    Takes O(len(nodes)) time.
+    :param n: ring size
+    :param nodes: np.array of nodes
+    :param starts: np.array of nodes to start scanning from
+    :param cut: tuple of indices of the cut, or of np.arrays of indices broadcastable against nodes
+    :return: np.array containing the first node j of a crossing demand (i, j), or i if there is none
+    """
+    g, h = np.minimum(*cut), np.maximum(*cut)
+    # a demand crosses the cut iff exactly one of its end nodes lies in the circular interval {g+1, ..., h}
+    nodes_inside = (g < nodes) & (nodes <= h)
+    starts_inside = (g < starts) & (starts <= h)
+
+    # the first node outside the interval is h + 1, the first node inside it is g + 1 (circularly)
+    next_inside = np.where(starts_inside, starts, g + 1)
+    next_outside = np.where(starts_inside, (h + 1) % n, starts)
+    next_crossing = np.where(nodes_inside, next_outside, next_inside)
+    # if the interval is empty, i.e. if g == h, no demand crosses the cut
+    next_crossing = np.where(g == h, nodes, next_crossing)
+
+    # stop at i if the scan reaches i before a crossing demand
+    reaches_node_first = (nodes - starts) % n <= (next_crossing - starts) % n
+    return np.where(reaches_node_first, nodes, next_crossing)
+
+
+def determine_routes_parallel_to_cut(first_nodes, second_nodes, cut):
+    """
+    Determines the routes of demands given a cut they are all parallel to. Vectorized version of
+    determine_route_parallel_to_cut that does not check whether the demands are in fact parallel to the cut.
+    In O(len(first_nodes)) time.
+    :param first_nodes: np.array of first end nodes of the demands
+    :param second_nodes: np.array of second end nodes of the demands
+    :param cut: tuple of indices of the cut, or of np.arrays of indices broadcastable against first_nodes
+    :return: np.array of routes
+    """
+    i, j = np.minimum(first_nodes, second_nodes), np.maximum(first_nodes, second_nodes)
+    g, h = np.minimum(*cut), np.maximum(*cut)
+    return np.where((i <= g) & (h < j), BACKWARD, FORWARD)
+
+
+# policies choosing among multiple tight cuts of a link:
+# 'first' and 'last' choose the cut with the smallest and largest index, 'narrowest' the cut whose smaller side has the
+# fewest nodes, i.e. the cut the most demands are parallel to, ties broken by index, and 'random' a uniformly random
+# cut drawn from a generator seeded by the given seed.
+TIE_BREAKS = ('first', 'last', 'narrowest', 'random')
+
+# relative tolerance of tight cuts for float64 demands, whose demands across cuts are summed in a different order than
+# the capacities and thus need not add up exactly
+FLOAT64_TOLERANCE = 1e-9
+
+
+def default_tolerance(dtype):
+    """
+    :param dtype: dtype of the demands
+    :return: FLOAT64_TOLERANCE for float64 demands, 0, i.e. exact comparison, otherwise
+    """
+    return FLOAT64_TOLERANCE if dtype == np.float64 else 0
+
+
+def find_tight_cuts(n, demands_across_cuts, capacities, tolerance=0, tie_break='first', seed=None,
+                    return_index=False, backend=None):
+    """
+    A O(n^2) algorithm for finding one tight cut for each link. The cut {i, j} is tight if
+    c_i + c_j = demands_across_cuts[i, j] up to the given tolerance. All tight cuts are found at once, so the choice
+    among them only depends on the instance and the tie-break policy.
+    :param n: ring size
+    :param demands_across_cuts: SymmetricMatrix containing demands across cuts
+    :param capacities: np.array containing capacities
+    :param tolerance: tolerance of the comparison relative to the largest demand across a cut, 0 for exact equality
+    :param tie_break: policy choosing among multiple tight cuts of a link, one of TIE_BREAKS
+    :param seed: seed of the random choice if tie_break is 'random'
+    :param return_index: whether to additionally return the index of all tight cuts, see tight_cut_index
+    :param backend: kernel backend, see utils.backends
+    :return: np.array containing one tight cut for each link, and the tuple (indptr, indices) if return_index is set
+    """
+    indptr, indices = tight_cut_index(n, demands_across_cuts, capacities, tolerance, backend)
+    if np.any(indptr[1:] == indptr[:-1]):
+        raise Exception("Found a link without tight cut!")
+    tight_cuts = select_tight_cuts(n, np.arange(n), indptr, indices, tie_break, seed)
+    if return_index:
+        return tight_cuts, (indptr, indices)
     return tight_cuts
 
 
+def tight_cut_index(n, demands_across_cuts, capacities, tolerance=0, backend=None):
+    """
+    Finds all tight cuts of all links in O(n^2) time and stores them compactly: the tight cuts {i, j} of link i are
+    indices[indptr[i]:indptr[i + 1]] in increasing order of j.
+    :param n: ring size
+    :param demands_across_cuts: SymmetricMatrix containing demands across cuts
+    :param capacities: np.array containing capacities
+    :param tolerance: tolerance of the comparison relative to the largest demand across a cut, 0 for exact equality
+    :param backend: kernel backend, see utils.backends
+    :return: np.array indptr of length n + 1, np.array indices
+    """
+    demands_across_cuts = np.asarray(demands_across_cuts).view(np.ndarray)
+    absolute_tolerance = tolerance * max(1, demands_across_cuts.max()) if tolerance > 0 and n > 0 else 0
+    counts = call_kernel('count_tight_cuts', demands_across_cuts, capacities, absolute_tolerance, backend=backend)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = call_kernel('list_tight_cuts', demands_across_cuts, capacities, absolute_tolerance, indptr,
+                          backend=backend)
+    return indptr, indices
+
+
+def select_tight_cuts(n, links, indptr, indices, tie_break='first', seed=None):
+    """
+    Chooses one tight cut for each of the given links from an index of tight cuts, see tight_cut_index, in which each
+    link has at least one tight cut. Takes O(K) time, where K is the number of tight cuts of the links.
+    :param n: ring size
+    :param links: np.array of the link of each row of the index
+    :param indptr: np.array of length len(links) + 1
+    :param indices: np.array of tight cuts
+    :param tie_break: policy choosing among multiple tight cuts of a link, one of TIE_BREAKS
+    :param seed: seed of the random choice if tie_break is 'random'
+    :return: np.array containing the chosen tight cut of each link
+    """
+    starts, ends = indptr[:-1], indptr[1:]
+    if tie_break not in TIE_BREAKS:
+        raise Exception(f"Unknown tie-break policy {tie_break}!")
+    if len(links) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if tie_break == 'first':
+        return indices[starts]
+    if tie_break == 'last':
+        return indices[ends - 1]
+    if tie_break == 'narrowest':
+        # the smaller side of the cut {i, j} has min(|i - j|, n - |i - j|) nodes
+        widths = np.abs(indices - np.repeat(links, ends - starts))
+        widths = np.minimum(widths, n - widths)
+        return np.minimum.reduceat(widths * n + indices, starts) % n
+    # random
+    return indices[starts + np.random.default_rng(seed).integers(0, ends - starts)]
+
+
+@kernel('count_tight_cuts')
+def _count_tight_cuts(demands_across_cuts, capacities, tolerance):
+    """
+    NumPy implementation of the number of tight cuts of each link.
+    """
+    tight = np.abs(capacities[:, None] + capacities[None, :] - demands_across_cuts) <= tolerance
+    return np.count_nonzero(tight, axis=1)
+
+
+@kernel('count_tight_cuts', NUMBA)
+def _count_tight_cuts_scalar(demands_across_cuts, capacities, tolerance):
+    """
+    Scalar implementation of the number of tight cuts of each link.
+    """
+    n = capacities.shape[0]
+    counts = np.zeros(n, dtype=np.int64)
+    for i in range(n):
+        for j in range(n):
+            if abs(capacities[j] + capacities[i] - demands_across_cuts[i, j]) <= tolerance:
+                counts[i] += 1
+    return counts
+
+
+@kernel('list_tight_cuts')
+def _list_tight_cuts(demands_across_cuts, capacities, tolerance, indptr):
+    """
+    NumPy implementation of the indices of the tight cuts of all links, given the offsets of each link in indptr.
+    """
+    tight = np.abs(capacities[:, None] + capacities[None, :] - demands_across_cuts) <= tolerance
+    return np.nonzero(tight)[1]
+
+
+@kernel('list_tight_cuts', NUMBA)
+def _list_tight_cuts_scalar(demands_across_cuts, capacities, tolerance, indptr):
+    """
+    Scalar implementation of the indices of the tight cuts of all links, given the offsets of each link in indptr.
+    """
+    n = capacities.shape[0]
+    indices = np.empty(indptr[n], dtype=np.int64)
+    for i in range(n):
+        position = indptr[i]
+        for j in range(n):
+            if abs(capacities[j] + capacities[i] - demands_across_cuts[i, j]) <= tolerance:
+                indices[position] = j
+                position += 1
+    return indices
+
+
+def update_tight_cuts(n, demands_across_cuts, capacities, tight_cuts, tolerance=0, tie_break='first', seed=None):
+    """
+    Updates tight cuts in place after demands across cuts or capacities have changed. Cuts that are still tight are
+    kept, for all other links a new tight cut is chosen. Takes O(n) time plus O(n) for each link that needs a new cut.
+    :param n: ring size
+    :param demands_across_cuts: SymmetricMatrix containing demands across cuts
+    :param capacities: np.array containing capacities
+    :param tight_cuts: np.array containing one previously tight cut for each link
+    :param tolerance: see find_tight_cuts
+    :param tie_break: see find_tight_cuts
+    :param seed: see find_tight_cuts
+    :return: np.array of links whose tight cut has changed
+    """
+    D = np.asarray(demands_across_cuts)
+    absolute_tolerance = tolerance * max(1, D.max()) if tolerance > 0 and n > 0 else 0
+    links = np.arange(n)
+    still_tight = np.abs(capacities + capacities[tight_cuts] - D[links, tight_cuts]) <= absolute_tolerance
+    stale_links = links[~still_tight]
+    stale_cuts = tight_cuts[stale_links]
+    if len(stale_links) == 0:
+        return stale_links
+
+    rows, indices = np.nonzero(
+        np.abs(capacities[stale_links, None] + capacities[None, :] - D[stale_links]) <= absolute_tolerance)
+    indptr = np.searchsorted(rows, np.arange(len(stale_links) + 1))
+    if np.any(indptr[1:] == indptr[:-1]):
+        raise Exception("Found a link without tight cut!")
+    tight_cuts[stale_links] = select_tight_cuts(n, stale_links, indptr, indices, tie_break, seed)
+    return stale_links[tight_cuts[stale_links] != stale_cuts]
+
+
+def find_stacked_tight_cuts(n, demands_across_cuts, capacities, tolerance=0, tie_break='first', seed=None):
+    """
+    Finds one tight cut for each link for a stack of instances of the same size at once in O(B n^2) time.
+    :param n: ring size
+    :param demands_across_cuts: np.array of shape (B, n, n) containing demands across cuts
+    :param capacities: np.array of shape (B, n) containing capacities
+    :param tolerance: see find_tight_cuts, relative to the largest demand across a cut of each instance
+    :param tie_break: see find_tight_cuts
+    :param seed: see find_tight_cuts
+    :return: np.array of shape (B, n) containing one tight cut for each link
+    """
+    B = demands_across_cuts.shape[0]
+    absolute_tolerances = np.zeros((B, 1, 1))
+    if tolerance > 0 and n > 0:
+        absolute_tolerances[:, 0, 0] = tolerance * np.maximum(1, demands_across_cuts.max(axis=(1, 2)))
+    tight = np.abs(capacities[:, None, :] + capacities[:, :, None] - demands_across_cuts) <= absolute_tolerances
+
+    # one row of the index for each link of each instance
+    rows, indices = np.nonzero(tight.reshape(B * n, n))
+    indptr = np.searchsorted(rows, np.arange(B * n + 1))
+    if np.any(indptr[1:] == indptr[:-1]):
+        raise Exception("Found a link without tight cut!")
+    links = np.tile(np.arange(n), B)
+    return select_tight_cuts(n, links, indptr, indices, tie_break, seed).reshape(B, n)
+
+
+def find_tight_cuts_by_rows(n, demands_across_cuts_row, capacities, tolerance=0, tie_break='first', seed=None):
+    """
+    A O(n^2) algorithm for finding one tight cut for each link, generating the demands across cuts one row at a time.
+    :param n: ring size
+    :param demands_across_cuts_row: function mapping an edge g to the np.array of demands across all cuts {g, h}
+    :param capacities: np.array containing capacities
+    :param tolerance: see find_tight_cuts, takes another pass over the rows if positive
+    :param tie_break: see find_tight_cuts
+    :param seed: see find_tight_cuts
+    :return: np.array containing one tight cut for each link
+    """
+    absolute_tolerance = 0
+    if tolerance > 0 and n > 0:
+        absolute_tolerance = tolerance * max(1, max(np.max(demands_across_cuts_row(i)) for i in range(n)))
+    # only compare row[:i + 1], i.e. the entries compute_capacities_by_rows computed the capacities from, since rows
+    # computed independently need not be exactly symmetric. The tight cut {i, j} is found for both links in row i.
+    rows = [[] for _ in range(n)]
+    for i in range(n):
+        differences = capacities[:i + 1] + capacities[i] - demands_across_cuts_row(i)[:i + 1]
+        tight = np.flatnonzero(np.abs(differences) <= absolute_tolerance)
+        rows[i].extend(tight.tolist())
+        for j in tight[tight < i].tolist():
+            # rows are processed in order, so the cuts of link j stay in increasing order
+            rows[j].append(i)
+    counts = np.array([len(row) for row in rows], dtype=np.int64)
+    if np.any(counts == 0):
+        raise Exception("Found a link without tight cut!")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    indices = np.array([j for row in rows for j in row], dtype=np.int64)
+    return select_tight_cuts(n, np.arange(n), indptr, indices, tie_break, seed)
+
+
 def determine_route_parallel_to_cut(demand, cut):
     """
     Determines the route of a demand given a cut it is parallel to.
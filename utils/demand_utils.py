@@ -1,4 +1,10 @@
+import hashlib
+import json
+
+import numpy as np
+
 from constants import UNROUTED
+from symmetric_matrix import SymmetricMatrix
 
 
 def find_parallel_demands(S):
@@ -26,7 +32,18 @@ def demands_are_parallel(i1, i2):
 
 def find_unrouted_demands(n, routing):
     """
-    Finds indices of unrouted demands in the given partial routing.
+    Finds indices of unrouted demands in the given partial routing in O(n^2) time, vectorized over the upper triangle.
+    :param n: ring size
+    :param routing: SymmetricMatrix containing the partial routing
+    :return: list of indices of unrouted demands, ordered by first and then second end node
+    """
+    first_nodes, second_nodes = np.nonzero(np.triu(np.asarray(routing) == UNROUTED, 1))
+    return list(zip(first_nodes.tolist(), second_nodes.tolist()))
+
+
+def find_unrouted_demands_sequential(n, routing):
+    """
+    Reference implementation of find_unrouted_demands looping over all demands.
     :param n: ring size
     :param routing: SymmetricMatrix containing the partial routing
     :return: list of indices of unrouted demands
@@ -36,4 +53,61 @@ def find_unrouted_demands(n, routing):
         for j in range(i + 1, n):
             if routing[i, j] == UNROUTED:
                 S.append((i, j))
-    return S
\ No newline at end of file
+    return S
+
+
+def demand_list_to_arrays(demands):
+    """
+    Converts a list of demands of type (i, j, d_{ij}) into arrays of first end nodes, second end nodes and values,
+    where the first end node of each demand is the smaller one.
+    :param demands: list of demands
+    :return: np.array of first end nodes, np.array of second end nodes, np.array of demand values
+    """
+    if len(demands) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=np.float32)
+    i, j, values = zip(*demands)
+    i, j = np.asarray(i, dtype=int), np.asarray(j, dtype=int)
+    return np.minimum(i, j), np.maximum(i, j), np.asarray(values)
+
+
+def demands_digest(n, first_nodes, second_nodes, values, options=None):
+    """
+    Computes a digest identifying an instance independently of the order of its demands and of zero demands.
+    Instances with the same digest have the same solution. Takes O(K) time if the demands are sorted, e.g. as
+    extracted from a matrix, and O(K log K) time otherwise, where K is the number of demands.
+    :param n: ring size
+    :param first_nodes: np.array of first end nodes of the demands
+    :param second_nodes: np.array of second end nodes of the demands
+    :param values: np.array of demand values
+    :param options: JSON-serializable dict of solver options that change the solution, e.g. integer mode
+    :return: hex digest
+    """
+    values = np.asarray(values)
+    nonzero = values != 0
+    first_nodes, second_nodes = np.asarray(first_nodes)[nonzero], np.asarray(second_nodes)[nonzero]
+    values = values[nonzero]
+    keys = np.minimum(first_nodes, second_nodes).astype(np.int64) * n + np.maximum(first_nodes, second_nodes)
+    if np.any(keys[1:] <= keys[:-1]):
+        order = np.argsort(keys, kind='stable')
+        keys, values = keys[order], values[order]
+
+    digest = hashlib.sha256()
+    # the dtype of the demands is part of the instance, since it determines the arithmetic of the solver
+    digest.update(json.dumps({'n': int(n), 'dtype': values.dtype.str, 'options': options or {}}).encode())
+    digest.update(keys.astype('<i8').tobytes())
+    digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def scale_integer_demands(n, demands):
+    """
+    Scales integer demands by 2 and converts them to int64, so that all demands across cuts are even and all
+    capacities and tight cuts can be computed exactly in integer arithmetic.
+    :param n: ring size
+    :param demands: SymmetricMatrix containing integer demands
+    :return: SymmetricMatrix containing the scaled demands
+    """
+    demands = np.asarray(demands)
+    if not np.issubdtype(demands.dtype, np.integer) and not np.all(demands == np.round(demands)):
+        raise Exception("Integer mode requires integer demands!")
+    return SymmetricMatrix(n, initial_values=2 * demands.astype(np.int64), check_symmetry=False)
@@ -0,0 +1,109 @@
+import contextlib
+import time
+import tracemalloc
+
+_NO_PHASE = contextlib.nullcontext()
+
+
+class SolveStats:
+    """
+    Statistics of a single solve: wall time and allocated memory of each phase and key sizes of intermediate results.
+    """
+    def __init__(self):
+        # phase name -> wall time in ms
+        self.phase_times_ms = {}
+        # phase name -> peak memory allocated during the phase in bytes, only if allocations are tracked
+        self.phase_allocations = {}
+        # name -> size, e.g. number of tight cuts, unrouted demands or size of the contracted instance
+        self.sizes = {}
+
+    @property
+    def total_time_ms(self):
+        return sum(self.phase_times_ms.values())
+
+    def __repr__(self):
+        return f'SolveStats(phase_times_ms={self.phase_times_ms}, phase_allocations={self.phase_allocations}, ' \
+               f'sizes={self.sizes})'
+
+
+class Instrumentation:
+    """
+    Opt-in instrumentation of a solver. Collects a SolveStats object and notifies subscribed hooks of each event.
+    Hooks are called as hook(event, name, value), where event is 'phase_start' (value None), 'phase_end' (value is the
+    wall time in ms) or 'size' (value is the size).
+    A disabled instrumentation does nothing, which is what solvers use if none is given.
+    """
+    def __init__(self, track_allocations=False, hooks=None, enabled=True):
+        """
+        :param track_allocations: whether to track allocated memory per phase using tracemalloc, which slows down
+        execution
+        :param hooks: list of callables to notify of events
+        :param enabled: whether to collect anything at all
+        """
+        self.enabled = enabled
+        self.track_allocations = track_allocations
+        self.hooks = list(hooks or [])
+        self.stats = SolveStats()
+
+    def subscribe(self, hook):
+        """
+        Subscribes a hook to all future events. Disabled instrumentations, among them the NO_INSTRUMENTATION shared by
+        all uninstrumented solves, have no events and take no hooks.
+        :param hook: callable taking event, name and value
+        """
+        if not self.enabled:
+            raise Exception("Cannot subscribe to a disabled instrumentation!")
+        self.hooks.append(hook)
+
+    def phase(self, name):
+        """
+        Context manager measuring a phase of the solver.
+        :param name: name of the phase
+        :return: context manager
+        """
+        if not self.enabled:
+            return _NO_PHASE
+        return self._measure_phase(name)
+
+    def record(self, name, size):
+        """
+        Records a key size of an intermediate result.
+        :param name: name of the size
+        :param size: the size
+        """
+        if not self.enabled:
+            return
+        self.stats.sizes[name] = size
+        self._notify('size', name, size)
+
+    @contextlib.contextmanager
+    def _measure_phase(self, name):
+        self._notify('phase_start', name, None)
+        started_tracing = False
+        if self.track_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            memory_start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        time_start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            time_ms = (time.perf_counter_ns() - time_start) / 1e6
+            self.stats.phase_times_ms[name] = self.stats.phase_times_ms.get(name, 0) + time_ms
+            if self.track_allocations:
+                peak = tracemalloc.get_traced_memory()[1] - memory_start
+                self.stats.phase_allocations[name] = max(self.stats.phase_allocations.get(name, 0), peak)
+                if started_tracing:
+                    tracemalloc.stop()
+            self._notify('phase_end', name, time_ms)
+
+    def _notify(self, event, name, value):
+        for hook in self.hooks:
+            hook(event, name, value)
+
+
+# default of all solvers, shared and thus never to be changed
+NO_INSTRUMENTATION = Instrumentation(enabled=False)
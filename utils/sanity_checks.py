@@ -1,9 +1,79 @@
+import collections
+
 import numpy as np
 
 from constants import FORWARD, UNROUTED
 from proposed.demands_across_cuts import compute_demands_across_cuts
 from proposed.residual_capacities import compute_link_loads
 
+# optimal: whether the maximal link load equals the lower bound
+# max_load: maximal link load of the routing
+# lower_bound: maximal demand across a cut divided by 2, which no routing can beat, since the two links of a cut carry
+# all demands across it
+# tight_cut: tuple (g, h), g < h, of a cut attaining the lower bound
+# complete: whether every demand is routed, i.e. has a routing in [0, 1]
+# cut_violations: np.array of shape (V, 2) of the cuts {g, h}, g < h, violating the cut condition with respect to
+# the given capacities, None if no capacities were given
+# capacity_violations: np.array of the links whose load exceeds the given capacities, None if none were given
+Certificate = collections.namedtuple('Certificate', ['optimal', 'max_load', 'lower_bound', 'tight_cut', 'complete',
+                                                     'cut_violations', 'capacity_violations'])
+
+
+def verify_routing(n, demands, routing, demands_across_cuts=None, capacities=None, tolerance=1e-6, scale=1):
+    """
+    Verifies a routing without printing anything and returns a certificate of its optimality or of what is wrong
+    with it. Takes O(n^2) time, all of it vectorized, and reuses the demands across cuts and capacities of the solve
+    if given.
+    :param n: ring size
+    :param demands: SymmetricMatrix of demands
+    :param routing: SymmetricMatrix containing the routing
+    :param demands_across_cuts: SymmetricMatrix containing demands across cuts, computed if None
+    :param capacities: np.array containing the capacities of the solve, cut condition and capacities are only checked
+    if given
+    :param tolerance: tolerance of all comparisons relative to the largest demand across a cut
+    :param scale: factor the demands were scaled by, e.g. 2 in integer mode. Loads and bounds in the certificate are
+    divided by it
+    :return: Certificate
+    """
+    if demands_across_cuts is None:
+        demands_across_cuts = compute_demands_across_cuts(n, demands)
+    D = np.asarray(demands_across_cuts)
+    routing = np.asarray(routing)
+
+    link_loads = compute_link_loads(n, routing, demands)
+    max_load = np.max(link_loads, initial=0)
+
+    g, h = np.unravel_index(np.argmax(D), D.shape) if n > 0 else (0, 0)
+    max_demand_across_cut = D[g, h] if n > 0 else 0
+    absolute_tolerance = tolerance * max(1, max_demand_across_cut)
+
+    routed = (0 <= routing) & (routing <= 1)
+    np.fill_diagonal(routed, True)
+    complete = bool(np.all(routed))
+
+    cut_violations, capacity_violations = None, None
+    if capacities is not None:
+        cut_violations = find_cut_violations(n, D, capacities, absolute_tolerance)
+        capacity_violations = np.nonzero(link_loads > capacities + absolute_tolerance)[0]
+
+    return Certificate(optimal=bool(complete and max_load <= max_demand_across_cut / 2 + absolute_tolerance),
+                       max_load=float(max_load / scale), lower_bound=float(max_demand_across_cut / 2 / scale),
+                       tight_cut=(int(min(g, h)), int(max(g, h))), complete=complete, cut_violations=cut_violations,
+                       capacity_violations=capacity_violations)
+
+
+def find_cut_violations(n, demands_across_cuts, capacities, tolerance=0):
+    """
+    Finds all cuts violating the cut condition for the given demands across cuts and capacities in O(n^2) time.
+    :param n: ring size
+    :param demands_across_cuts: SymmetricMatrix containing demands across cuts
+    :param capacities: np.array containing capacities
+    :param tolerance: absolute tolerance of the comparison
+    :return: np.array of shape (V, 2) containing the cuts {g, h}, g < h, violating the cut condition
+    """
+    violated = np.asarray(demands_across_cuts) > capacities[:, None] + capacities[None, :] + tolerance
+    return np.argwhere(np.triu(violated, 1))
+
 
 def check_cut_condition(n, demands_across_cuts, capacities):
     """
@@ -13,11 +83,10 @@ def check_cut_condition(n, demands_across_cuts, capacities):
     :param capacities: np.array containing capacities
     :return: whether the cut condition is satisfied
     """
-    for i in range(0, n - 1):
-        for j in range(i + 1, n):
-            if demands_across_cuts[i, j] > capacities[i] + capacities[j]:
-                print(f"Cut condition violated for cut {(i, j)}!")
-                return False
+    violations = find_cut_violations(n, demands_across_cuts, capacities)
+    if len(violations) > 0:
+        print(f"Cut condition violated for cut {tuple(violations[0].tolist())}!")
+        return False
     return True
 
 
@@ -29,7 +98,7 @@ def is_complete_routing(routing):
     """
     copy = routing.copy()
     np.fill_diagonal(copy, FORWARD)
-    return np.alltrue(copy != UNROUTED) and np.alltrue(copy >= 0)
+    return np.all(copy != UNROUTED) and np.all(copy >= 0)
 
 
 def is_optimal_routing(n, demands, routing):
@@ -40,9 +109,6 @@ def is_optimal_routing(n, demands, routing):
     :param routing: SymmetricMatrix containing the routing
     :return: whether the given routing is optimal
     """
-    link_loads = compute_link_loads(n, routing, demands)
-    max_load = np.max(link_loads)
-    max_demand_across_cut = np.max(compute_demands_across_cuts(n, demands))
-
-    print(f'Difference to optimal: {max_load - max_demand_across_cut/2}')
-    return np.isclose(max_load, max_demand_across_cut / 2)
+    certificate = verify_routing(n, demands, routing)
+    print(f'Difference to optimal: {certificate.max_load - certificate.lower_bound}')
+    return np.isclose(certificate.max_load, certificate.lower_bound)